@@ -8,7 +8,9 @@ __version__ = "1.1.2"
 __author__ = "shx-dow"
 
 from .client import (
+    close_idle_connections,
     do_download,
+    do_download_many,
     do_upload_request,
     fetch_file_list,
     format_size,
@@ -16,6 +18,7 @@ from .client import (
 from .config import (
     BROADCAST_INTERVAL,
     BUFFER_SIZE,
+    BULK_BUFFER_SIZE,
     PEER_ID,
     PEER_TIMEOUT,
     SEPARATOR,
@@ -24,13 +27,22 @@ from .config import (
     UDP_PORT,
 )
 from .discovery import PeerDiscovery
-from .protocol import recv_file, recv_msg, send_file, send_msg
+from .protocol import (
+    corked,
+    recv_file,
+    recv_msg,
+    send_bytes,
+    send_file,
+    send_file_data,
+    send_msg,
+)
 from .server import FileServer
 
 __all__ = [
     "TCP_PORT",
     "UDP_PORT",
     "BUFFER_SIZE",
+    "BULK_BUFFER_SIZE",
     "BROADCAST_INTERVAL",
     "PEER_TIMEOUT",
     "SEPARATOR",
@@ -39,11 +51,16 @@ __all__ = [
     "PeerDiscovery",
     "FileServer",
     "fetch_file_list",
+    "close_idle_connections",
     "do_download",
+    "do_download_many",
     "do_upload_request",
     "format_size",
+    "corked",
+    "send_bytes",
     "send_msg",
     "recv_msg",
     "send_file",
+    "send_file_data",
     "recv_file",
 ]
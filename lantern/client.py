@@ -1,9 +1,14 @@
 """
 TCP client — connects to a remote peer and performs file operations.
 
-Each operation opens a fresh TCP connection, sends a command, processes the
-response, and closes the connection.  This keeps the protocol stateless and
-simple.
+LIST and DOWNLOAD reuse an idle connection to the same peer when one is
+pooled (the server keeps a connection open across those commands), saving
+a TCP handshake per operation.  Uploads always use a fresh connection,
+since the server ends the session after an upload.
+
+The last listing fetched from each peer is kept along with the tag the
+server gave it; LIST sends the tag back and the server only resends the
+listing if it changed.
 
 Two API layers:
   - Core functions (fetch_*) return structured data for the TUI.
@@ -11,14 +16,20 @@ Two API layers:
 """
 
 import os
+import re
 import shutil
 import socket
 import threading
+import time
+from functools import lru_cache
 
 from typing_extensions import Callable
 
-from .config import BUFFER_SIZE, SEPARATOR, SHARED_DIR
-from .protocol import recv_file, recv_msg, send_msg
+from .config import SEPARATOR, SHARED_DIR
+from .protocol import recv_file, recv_msg, send_file_data, send_msg, tune_socket
+
+# One "<name><SEP><size>" entry per line of a LIST response.
+_LISTING_ENTRY = re.compile(rf"^(.*?){re.escape(SEPARATOR)}(\d+)$", re.MULTILINE)
 
 
 def _has_enough_space(directory: str, required_bytes: int) -> bool:
@@ -33,6 +44,7 @@ def _connect(host: str, port: int, timeout: float = 10) -> socket.socket:
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     sock.settimeout(timeout)
     try:
+        tune_socket(sock)
         sock.connect((host, port))
     except Exception:
         sock.close()
@@ -40,13 +52,142 @@ def _connect(host: str, port: int, timeout: float = 10) -> socket.socket:
     return sock
 
 
+# Seconds an idle pooled connection may sit unused before it is closed
+# rather than reused.
+POOL_IDLE_TIMEOUT = 30
+
+# Idle connections kept per peer.  Each one ties up a worker and a connection
+# slot on the peer's FileServer until it is reused or times out there, so the
+# surplus left by a burst of concurrent transfers is closed, not pooled.
+POOL_MAX_IDLE_PER_PEER = 2
+
+# Idle connections per (host, port), each with the monotonic time it was
+# returned to the pool.
+_idle_connections: dict[tuple[str, int], list[tuple[float, socket.socket]]] = {}
+_idle_lock = threading.Lock()
+
+
+def _is_reusable(sock: socket.socket) -> bool:
+    """True if a pooled connection is still open and has nothing unread.
+
+    A connection the peer closed while idle reads as EOF; any unread data
+    means the stream is out of step with the protocol.
+    """
+    try:
+        sock.settimeout(0)
+        sock.recv(1, socket.MSG_PEEK)
+    except BlockingIOError:
+        return True
+    except OSError:
+        pass
+    return False
+
+
+def _checkout(host: str, port: int, timeout: float) -> tuple[socket.socket, bool]:
+    """Return (sock, reused): a live pooled connection, or a new one."""
+    sock = None
+    expired: list[socket.socket] = []
+    with _idle_lock:
+        idle = _idle_connections.get((host, port))
+        if idle:
+            since, sock = idle.pop()
+            if time.monotonic() - since >= POOL_IDLE_TIMEOUT:
+                # Entries are in check-in order, so the rest are older still.
+                expired = [sock] + [s for _, s in idle]
+                idle.clear()
+                sock = None
+    for stale in expired:
+        stale.close()
+
+    if sock is not None:
+        if _is_reusable(sock):
+            sock.settimeout(timeout)
+            return sock, True
+        sock.close()
+    return _connect(host, port, timeout), False
+
+
+def _checkin(host: str, port: int, sock: socket.socket) -> None:
+    """Return *sock* to the pool.
+
+    Expired connections to any peer are closed here too, rather than left
+    open until the next checkout for that peer, as are the oldest idle
+    connections to this peer beyond POOL_MAX_IDLE_PER_PEER.
+    """
+    now = time.monotonic()
+    closing: list[socket.socket] = []
+    with _idle_lock:
+        for key, idle in list(_idle_connections.items()):
+            # Entries are in check-in order, so the expired ones come first.
+            while idle and now - idle[0][0] >= POOL_IDLE_TIMEOUT:
+                closing.append(idle.pop(0)[1])
+            if not idle:
+                del _idle_connections[key]
+        idle = _idle_connections.setdefault((host, port), [])
+        idle.append((now, sock))
+        while len(idle) > POOL_MAX_IDLE_PER_PEER:
+            closing.append(idle.pop(0)[1])
+    for stale in closing:
+        stale.close()
+
+
+def _pooled_exchange(host: str, port: int, timeout: float, request: str, finish):
+    """Send *request* over a pooled connection to host:port and return
+    ``finish(sock, response)`` for the reply.
+
+    A reused connection that the peer has since reset fails on the send or
+    before any reply arrives; only then is the request resent, once, on a
+    fresh connection.  Once a reply is in hand *finish* may already have
+    written files or reported progress, so its failures are never retried.
+    The connection only goes back to the pool when *finish* returns; on any
+    error it is closed, since the stream may be mid-message.
+    """
+    sock, reused = _checkout(host, port, timeout)
+    try:
+        try:
+            send_msg(sock, request)
+            response = recv_msg(sock)
+            if response is None and reused:
+                raise ConnectionResetError
+        except (BrokenPipeError, ConnectionResetError):
+            if not reused:
+                raise
+            sock.close()
+            sock = _connect(host, port, timeout)
+            send_msg(sock, request)
+            response = recv_msg(sock)
+        result = finish(sock, response)
+    except BaseException:
+        sock.close()
+        raise
+    _checkin(host, port, sock)
+    return result
+
+
+def close_idle_connections() -> None:
+    """Close every pooled connection."""
+    with _idle_lock:
+        pooled = [sock for idle in _idle_connections.values() for _, sock in idle]
+        _idle_connections.clear()
+    for sock in pooled:
+        sock.close()
+
+
+_SIZE_UNITS = ("B", "KB", "MB", "GB", "TB")
+
+
+# Tables and progress lines format the same sizes over and over.
+@lru_cache(maxsize=4096)
 def format_size(size_bytes: int | float) -> str:
     """Human-readable file size."""
-    for unit in ("B", "KB", "MB", "GB"):
-        if size_bytes < 1024:
-            return f"{size_bytes:.1f} {unit}"
-        size_bytes /= 1024
-    return f"{size_bytes:.1f} TB"
+    # Each unit is 2**10 of the previous one, so the unit index falls out of
+    # the bit length directly instead of dividing in a loop.
+    index = min(len(_SIZE_UNITS) - 1, max(0, (int(size_bytes).bit_length() - 1) // 10))
+    return f"{size_bytes / (1 << (index * 10)):.1f} {_SIZE_UNITS[index]}"
+
+
+# (host, port) -> (tag, files) of the last listing fetched from that peer.
+_listings: dict[tuple[str, int], tuple[str, list[dict]]] = {}
 
 
 def fetch_file_list(host: str, port: int) -> list[dict]:
@@ -56,29 +197,48 @@ def fetch_file_list(host: str, port: int) -> list[dict]:
     Returns a list of dicts: [{"name": str, "size": int}, ...]
     Raises RuntimeError on protocol errors.
     """
-    sock = _connect(host, port)
-    try:
-        send_msg(sock, "LIST")
-        response = recv_msg(sock)
-        if response is None:
-            raise RuntimeError("No response from peer")
-
-        parts = response.split(SEPARATOR, 1)
-        if parts[0] != "OK":
-            raise RuntimeError(parts[1] if len(parts) > 1 else "Unknown error")
-
+    cached = _listings.get((host, port))
+    # Peers that predate listing tags ignore the argument and reply OK.
+    return _pooled_exchange(
+        host,
+        port,
+        10,
+        f"LIST{SEPARATOR}{cached[0] if cached else ''}",
+        lambda sock, response: _read_listing(response, host, port, cached),
+    )
+
+
+def _read_listing(
+    response: str | None,
+    host: str,
+    port: int,
+    cached: tuple[str, list[dict]] | None,
+) -> list[dict]:
+    """Parse the reply to a LIST sent with *cached*'s tag."""
+    if response is None:
+        raise RuntimeError("No response from peer")
+
+    if response == "NOT_MODIFIED" and cached:
+        return list(cached[1])
+
+    parts = response.split(SEPARATOR, 1)
+    tag = None
+    if parts[0] == "MODIFIED" and len(parts) > 1:
+        tag, _, listing = parts[1].partition(SEPARATOR)
+    elif parts[0] == "OK":
         listing = parts[1] if len(parts) > 1 else ""
-        if not listing.strip():
-            return []
-
-        files = []
-        for line in listing.split("\n"):
-            if SEPARATOR in line:
-                name, size_str = line.split(SEPARATOR, 1)
-                files.append({"name": name, "size": int(size_str)})
-        return files
-    finally:
-        sock.close()
+    else:
+        raise RuntimeError(parts[1] if len(parts) > 1 else "Unknown error")
+
+    files = [
+        {"name": name, "size": int(size)}
+        for name, size in _LISTING_ENTRY.findall(listing)
+    ]
+    if tag:
+        _listings[(host, port)] = (tag, files)
+    else:
+        _listings.pop((host, port), None)
+    return list(files)
 
 
 def do_download(
@@ -96,45 +256,96 @@ def do_download(
     progress_callback: optional callable(current_bytes, total_bytes) for UI updates
     cancel_event: optional threading.Event to cancel the transfer
     """
-    sock = _connect(host, port, timeout=30)
-    try:
-        send_msg(sock, f"DOWNLOAD{SEPARATOR}{filename}")
-        response = recv_msg(sock)
-        if response is None:
-            raise RuntimeError("No response from peer")
+    return _pooled_exchange(
+        host,
+        port,
+        30,
+        f"DOWNLOAD{SEPARATOR}{filename}",
+        lambda sock, response: _receive_download(
+            sock, response, filename, progress_callback, cancel_event
+        ),
+    )
+
+
+def do_download_many(
+    host: str,
+    port: int,
+    filenames: list[str],
+    progress_callback: Callable[[int, int], None] | None = None,
+    cancel_event: threading.Event | None = None,
+) -> list[tuple[str, int]]:
+    """
+    Download several files from a remote peer over a single connection.
 
-        if response.startswith("ERROR"):
-            parts = response.split(SEPARATOR, 1)
-            raise RuntimeError(parts[1] if len(parts) > 1 else "Unknown error")
+    Saves a TCP handshake per file and keeps the congestion window warm
+    between files.  Returns [(destination_path, bytes_received), ...] in
+    request order.  Raises RuntimeError on the first failure.
+    progress_callback: optional callable(current_bytes, total_bytes), per file
+    cancel_event: optional threading.Event to cancel the remaining transfers
+    """
+    if not filenames:
+        return []
+    first, *rest = filenames
+
+    def finish(sock: socket.socket, response: str | None) -> list[tuple[str, int]]:
+        results = [
+            _receive_download(sock, response, first, progress_callback, cancel_event)
+        ]
+        for filename in rest:
+            send_msg(sock, f"DOWNLOAD{SEPARATOR}{filename}")
+            results.append(
+                _receive_download(
+                    sock, recv_msg(sock), filename, progress_callback, cancel_event
+                )
+            )
+        return results
 
-        parts = response.split(SEPARATOR, 1)
-        if parts[0] != "OK" or len(parts) < 2:
-            raise RuntimeError("Invalid response from peer")
+    return _pooled_exchange(host, port, 30, f"DOWNLOAD{SEPARATOR}{first}", finish)
 
-        try:
-            filesize = int(parts[1])
-        except ValueError:
-            raise RuntimeError(f"Invalid file size in response: {parts[1]}")
-        if filesize < 0:
-            raise RuntimeError(f"Invalid file size in response: {parts[1]}")
-
-        os.makedirs(SHARED_DIR, exist_ok=True)
-        safe_name = os.path.basename(filename)
-        if not safe_name:
-            raise RuntimeError(
-                f"Filename is invalid or empty after sanitization: {filename!r}"
-            )
-        dest = os.path.join(SHARED_DIR, safe_name)
-        if not _has_enough_space(SHARED_DIR, filesize):
-            raise RuntimeError(f"Not enough free disk space in {SHARED_DIR}")
-        received = recv_file(sock, dest, filesize, progress_callback, cancel_event or threading.Event())
 
-        if cancel_event and cancel_event.is_set():
-            raise RuntimeError("Transfer cancelled")
+def _receive_download(
+    sock: socket.socket,
+    response: str | None,
+    filename: str,
+    progress_callback: Callable[[int, int], None] | None,
+    cancel_event: threading.Event | None,
+) -> tuple[str, int]:
+    """Handle the reply to a DOWNLOAD of *filename*, receiving the file."""
+    if response is None:
+        raise RuntimeError("No response from peer")
 
-        return dest, received
-    finally:
-        sock.close()
+    if response.startswith("ERROR"):
+        parts = response.split(SEPARATOR, 1)
+        raise RuntimeError(parts[1] if len(parts) > 1 else "Unknown error")
+
+    parts = response.split(SEPARATOR, 1)
+    if parts[0] != "OK" or len(parts) < 2:
+        raise RuntimeError("Invalid response from peer")
+
+    try:
+        filesize = int(parts[1])
+    except ValueError:
+        raise RuntimeError(f"Invalid file size in response: {parts[1]}")
+    if filesize < 0:
+        raise RuntimeError(f"Invalid file size in response: {parts[1]}")
+
+    os.makedirs(SHARED_DIR, exist_ok=True)
+    safe_name = os.path.basename(filename)
+    if not safe_name:
+        raise RuntimeError(
+            f"Filename is invalid or empty after sanitization: {filename!r}"
+        )
+    dest = os.path.join(SHARED_DIR, safe_name)
+    if not _has_enough_space(SHARED_DIR, filesize):
+        raise RuntimeError(f"Not enough free disk space in {SHARED_DIR}")
+    received = recv_file(sock, dest, filesize, progress_callback, cancel_event or threading.Event())
+
+    if cancel_event and cancel_event.is_set():
+        raise RuntimeError("Transfer cancelled")
+    if received != filesize:
+        raise RuntimeError(f"Incomplete transfer: got {received}/{filesize} bytes")
+
+    return dest, received
 
 
 def do_upload_request(
@@ -170,18 +381,8 @@ def do_upload_request(
                 f"Peer rejected upload: {parts[1] if len(parts) > 1 else 'unknown'}"
             )
 
-        sent = 0
         with open(filepath, "rb") as f:
-            while sent < filesize:
-                if cancel_event and cancel_event.is_set():
-                    raise RuntimeError("Transfer cancelled")
-                chunk = f.read(BUFFER_SIZE)
-                if not chunk:
-                    break
-                sock.sendall(chunk)
-                sent += len(chunk)
-                if progress_callback:
-                    progress_callback(sent, filesize)
+            send_file_data(sock, f, filesize, progress_callback, cancel_event)
 
         if cancel_event and cancel_event.is_set():
             raise RuntimeError("Transfer cancelled")
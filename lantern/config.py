@@ -4,6 +4,15 @@ import uuid
 TCP_PORT = 5000
 UDP_PORT = 5001
 BUFFER_SIZE = 65536
+# Read size for file bodies, kept separate from the control-message buffer.
+# Larger reads mean fewer syscalls per byte; tune together with the link.
+BULK_BUFFER_SIZE = 256 * 1024
+# Fixed kernel send/receive buffer for transfer sockets, or None to leave
+# sizing to the kernel.  Setting it turns off TCP buffer autotuning, and the
+# kernel caps it at net.core.wmem_max / rmem_max (about 208 KiB on stock
+# Linux, well below what autotuning reaches), so only set it, to the link's
+# bandwidth-delay product, on platforms or links where autotuning falls short.
+SOCKET_BUFFER_SIZE: int | None = None
 BROADCAST_INTERVAL = 5
 PEER_TIMEOUT = 15
 SEPARATOR = "<SEP>"
@@ -12,24 +12,73 @@ The hostname field is last so that colons inside a hostname (valid on some
 systems) do not corrupt parsing — the first three fields are always fixed.
 """
 
+import ipaddress
 import platform
+import selectors
 import socket
+import struct
+import sys
 import threading
 import time
 
 from .config import BROADCAST_INTERVAL, PEER_ID, PEER_TIMEOUT, TCP_PORT, UDP_PORT
 
-try:
-    import psutil
+# last_seen stamps are monotonic nanoseconds: immune to wall-clock jumps and
+# compared with integer arithmetic only.
+_PEER_TIMEOUT_NS = PEER_TIMEOUT * 1_000_000_000
 
-    PSUTIL_AVAILABLE = True
-except ImportError:
-    PSUTIL_AVAILABLE = False
+# Seconds between re-reading the local interfaces' broadcast addresses.
+ADDRESS_REFRESH_INTERVAL = 300
+
+_BEACON_PREFIX = b"LANTERN_DISCOVER:"
+_BEACON_PREFIX_LEN = len(_BEACON_PREFIX)
+
+# ioctl request for an interface's IPv4 broadcast address (linux/sockios.h).
+_SIOCGIFBRDADDR = 0x8919
 
 
 def get_broadcast_addresses():
     """Get all broadcast addresses for local interfaces."""
-    if not PSUTIL_AVAILABLE:
+    if sys.platform.startswith("linux"):
+        try:
+            broadcasts = _linux_broadcast_addresses()
+        except OSError:
+            broadcasts = []
+        if broadcasts:
+            return broadcasts
+
+    return _psutil_broadcast_addresses()
+
+
+def _linux_broadcast_addresses() -> list[str]:
+    """Ask the kernel for each interface's broadcast address via ioctl.
+
+    Avoids importing psutil (and its C extension) on Linux.  Interfaces
+    without an IPv4 address make the ioctl fail and are skipped.
+    """
+    import fcntl
+
+    broadcasts = []
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for _, name in socket.if_nameindex():
+            request = struct.pack("256s", name[:15].encode())
+            try:
+                result = fcntl.ioctl(sock.fileno(), _SIOCGIFBRDADDR, request)
+            except OSError:
+                continue
+            # struct ifreq: 16-byte name, then a sockaddr_in whose address
+            # field starts 4 bytes in.
+            broadcast = socket.inet_ntoa(result[20:24])
+            if broadcast == "0.0.0.0" or broadcast.startswith("127."):
+                continue
+            broadcasts.append(broadcast)
+    return broadcasts
+
+
+def _psutil_broadcast_addresses() -> list[str]:
+    try:
+        import psutil
+    except ImportError:
         return ["<broadcast>", "255.255.255.255"]
 
     broadcasts = []
@@ -41,12 +90,10 @@ def get_broadcast_addresses():
                     continue
                 if addr.netmask is None:
                     continue
-                ip_parts = addr.address.split(".")
-                mask_parts = addr.netmask.split(".")
-                broadcast = ".".join(
-                    str(int(ip_parts[i]) | (255 - int(mask_parts[i]))) for i in range(4)
+                network = ipaddress.IPv4Network(
+                    f"{addr.address}/{addr.netmask}", strict=False
                 )
-                broadcasts.append(broadcast)
+                broadcasts.append(str(network.broadcast_address))
 
     return broadcasts if broadcasts else ["255.255.255.255"]
 
@@ -59,70 +106,121 @@ class PeerDiscovery:
         self.peer_id = PEER_ID
         self.hostname = platform.node() or "unknown"
 
+        # Writers mutate _peers under _lock and then publish a fresh copy as
+        # _peers_snapshot; readers only ever look at the snapshot, so
+        # get_peers() never waits on beacon handling.
         self._peers: dict[str, dict] = {}
+        self._peers_snapshot: dict[str, dict] = {}
         self._lock = threading.Lock()
         self._running = False
+        self._wake_r: socket.socket | None = None
+        self._wake_w: socket.socket | None = None
+
+        # The beacon never changes for the lifetime of the process, so the
+        # payload and destination addresses are built once up front.
+        payload = f"LANTERN_DISCOVER:{self.peer_id}:{self.tcp_port}:{self.hostname}"
+        self._beacon_data = payload.encode("utf-8")
+        self._beacon_addrs: list[tuple[str, int]] = []
+        self._beacon_addrs_updated = 0.0
+        self._refresh_beacon_addrs()
 
     def start(self) -> None:
-        """Start the beacon and listener threads (daemon threads)."""
+        """Start the beacon, listener and expirer threads (daemon threads)."""
         self._running = True
+        self._wake_r, self._wake_w = socket.socketpair()
 
         beacon_thread = threading.Thread(target=self._beacon_loop, daemon=True)
         listener_thread = threading.Thread(target=self._listener_loop, daemon=True)
+        expirer_thread = threading.Thread(target=self._expirer_loop, daemon=True)
 
         beacon_thread.start()
         listener_thread.start()
+        expirer_thread.start()
 
     def stop(self) -> None:
         self._running = False
+        # Wake the listener out of select() so it exits immediately.
+        if self._wake_w is not None:
+            try:
+                self._wake_w.send(b"x")
+            except OSError:
+                pass
+            self._wake_w.close()
+            self._wake_w = None
 
     def get_peers(self) -> list[dict]:
-        """Return a list of currently active peers (excluding self)."""
-        now = time.time()
-        active = []
+        """Return a list of currently active peers (excluding self).
+
+        Stale peers are evicted by the expirer thread, so this is a plain copy
+        of the current snapshot.
+        """
+        return [
+            {
+                "peer_id": pid,
+                "ip": info["ip"],
+                "hostname": info["hostname"],
+                "tcp_port": info["tcp_port"],
+            }
+            for pid, info in self._peers_snapshot.items()
+        ]
+
+    def _expirer_loop(self) -> None:
+        while self._running:
+            time.sleep(PEER_TIMEOUT / 2)
+            self._evict_expired()
+
+    def _evict_expired(self) -> None:
+        """Drop peers whose last beacon is older than PEER_TIMEOUT."""
+        now = time.monotonic_ns()
         with self._lock:
-            expired = []
-            for pid, info in self._peers.items():
-                if now - info["last_seen"] > PEER_TIMEOUT:
-                    expired.append(pid)
-                else:
-                    active.append(
-                        {
-                            "peer_id": pid,
-                            "ip": info["ip"],
-                            "hostname": info["hostname"],
-                            "tcp_port": info["tcp_port"],
-                        }
-                    )
+            expired = [
+                pid
+                for pid, info in self._peers.items()
+                if now - info["last_seen"] > _PEER_TIMEOUT_NS
+            ]
+            if not expired:
+                return
             for pid in expired:
                 del self._peers[pid]
-        return active
+            self._peers_snapshot = self._peers.copy()
 
     def _beacon_loop(self) -> None:
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
         sock.settimeout(1)
 
-        payload = f"LANTERN_DISCOVER:{self.peer_id}:{self.tcp_port}:{self.hostname}"
-        data = payload.encode("utf-8")
+        while self._running:
+            if time.monotonic() - self._beacon_addrs_updated > ADDRESS_REFRESH_INTERVAL:
+                self._refresh_beacon_addrs()
+            self._send_beacon(sock)
+            time.sleep(BROADCAST_INTERVAL)
+
+        sock.close()
+
+    def _refresh_beacon_addrs(self) -> None:
+        """Recompute the broadcast targets.
 
+        Interfaces rarely change, so this runs at startup and then only every
+        ADDRESS_REFRESH_INTERVAL seconds (e.g. to pick up a new Wi-Fi network).
+        """
         try:
             broadcasts = get_broadcast_addresses()
         except Exception:
             broadcasts = ["<broadcast>"]
+        self._beacon_addrs = [(addr, UDP_PORT) for addr in broadcasts]
+        self._beacon_addrs_updated = time.monotonic()
 
-        while self._running:
+    def _send_beacon(self, sock: socket.socket) -> None:
+        """Send the precomputed beacon to every cached broadcast address.
+
+        A failure on one interface must not stop the beacon reaching the others.
+        """
+        data = self._beacon_data
+        for addr in self._beacon_addrs:
             try:
-                for addr in broadcasts:
-                    try:
-                        sock.sendto(data, (addr, UDP_PORT))
-                    except Exception:
-                        pass
+                sock.sendto(data, addr)
             except OSError:
                 pass
-            time.sleep(BROADCAST_INTERVAL)
-
-        sock.close()
 
     def _listener_loop(self) -> None:
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -134,50 +232,69 @@ class PeerDiscovery:
             except OSError:
                 pass
 
+        wake = self._wake_r
         try:
             sock.bind(("", UDP_PORT))
         except Exception:
+            sock.close()
+            if wake is not None:
+                wake.close()
             return
 
-        sock.settimeout(2)
-
-        while self._running:
-            try:
-                raw, (sender_ip, _) = sock.recvfrom(4096)
-            except socket.timeout:
-                continue
-            except OSError:
-                continue
-
-            try:
-                message = raw.decode("utf-8")
-            except UnicodeDecodeError:
-                continue
+        sock.setblocking(False)
+
+        # Block until a datagram arrives or stop() writes to the wake-up
+        # socket, instead of waking on a timeout to poll _running.
+        with selectors.DefaultSelector() as selector:
+            selector.register(sock, selectors.EVENT_READ)
+            if wake is not None:
+                selector.register(wake, selectors.EVENT_READ)
+
+            while self._running:
+                ready = {key.fileobj for key, _ in selector.select()}
+                if wake in ready:
+                    break
+
+                try:
+                    # recvfrom() shrinks its buffer to the datagram in place,
+                    # so each beacon costs a single bytes object.
+                    raw, (sender_ip, _) = sock.recvfrom(4096)
+                except OSError:
+                    continue
 
-            self._handle_beacon(message, sender_ip)
+                self._handle_beacon(raw, sender_ip)
 
         sock.close()
+        if wake is not None:
+            wake.close()
 
-    def _handle_beacon(self, message: str, sender_ip: str) -> None:
-        """Parse a beacon message and update the known-peers dict.
+    def _handle_beacon(self, raw: bytes, sender_ip: str) -> None:
+        """Parse a raw beacon packet and update the known-peers dict.
 
         Format: LANTERN_DISCOVER:<peer_id>:<tcp_port>:<hostname>
-        The hostname is split last (maxsplit=3) so colons inside it are preserved.
+        Works on the undecoded bytes so that foreign broadcasts are rejected by
+        the prefix check alone.  The hostname is split last (maxsplit=2 after
+        the prefix) so colons inside it are preserved.
         """
-        parts = message.split(":", 3)
-        if len(parts) != 4 or parts[0] != "LANTERN_DISCOVER":
+        if not raw.startswith(_BEACON_PREFIX):
             return
 
-        _, peer_id, tcp_port_str, hostname = parts
-
-        if peer_id == self.peer_id:
+        fields = raw[_BEACON_PREFIX_LEN:].split(b":", 2)
+        if len(fields) != 3:
             return
 
+        peer_id_raw, tcp_port_raw, hostname_raw = fields
+
         try:
-            tcp_port = int(tcp_port_str)
+            peer_id = peer_id_raw.decode("utf-8")
+            tcp_port = int(tcp_port_raw)
+            hostname = hostname_raw.decode("utf-8")
         except ValueError:
             return
 
+        if peer_id == self.peer_id:
+            return
+
         if not (1 <= tcp_port <= 65535):
             return
 
@@ -186,5 +303,6 @@ class PeerDiscovery:
                 "ip": sender_ip,
                 "hostname": hostname,
                 "tcp_port": tcp_port,
-                "last_seen": time.time(),
+                "last_seen": time.monotonic_ns(),
             }
+            self._peers_snapshot = self._peers.copy()
@@ -8,29 +8,98 @@ knows exactly how many bytes to read for each message.
 """
 
 import contextlib
+import errno
+import io
+import mmap
 import os
+import select
+import socket
 import struct
 import tempfile
 import threading
 
 from typing_extensions import Callable
 
-from .config import BUFFER_SIZE
+from .config import BUFFER_SIZE, BULK_BUFFER_SIZE, SOCKET_BUFFER_SIZE
 
 MAX_MSG_SIZE = 64 * 1024  # 64 KB
+_LEN_PREFIX = struct.Struct("!I")
+# Files at least this large are spliced into the destination (Linux) or
+# received through an mmap of it.
+MMAP_MIN_SIZE = 1024 * 1024  # 1 MB
+# Bytes handed to the kernel per sendfile() call in send_file_data; bounds
+# how often progress is reported and cancellation is checked.
+SENDFILE_BLOCK_SIZE = 16 * BUFFER_SIZE
+_TCP_QUICKACK = getattr(socket, "TCP_QUICKACK", None)
+_O_NOFOLLOW = getattr(os, "O_NOFOLLOW", 0)
+# open() with O_NOFOLLOW reports a symlink as ELOOP (EMLINK on FreeBSD).
+_SYMLINK_ERRNOS = frozenset({errno.ELOOP, errno.EMLINK})
+_TCP_CORK = getattr(socket, "TCP_CORK", None)
+
+
+def tune_socket(sock) -> None:
+    """Disable Nagle for the small control messages and, if
+    SOCKET_BUFFER_SIZE is set, fix the kernel buffer sizes.
+
+    Call before connect() / listen(): buffer sizes are only taken into
+    account for the TCP window scale at connection setup, and accepted
+    sockets inherit them from the listener.  Options the platform rejects
+    are skipped.
+    """
+    options = [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)]
+    # Left unset by default so the kernel keeps autotuning the buffers.
+    if SOCKET_BUFFER_SIZE is not None:
+        options += [
+            (socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE),
+            (socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE),
+        ]
+    for level, option, value in options:
+        try:
+            sock.setsockopt(level, option, value)
+        except OSError:
+            pass
+
+
+def _quickack(sock) -> None:
+    """ACK the next incoming segment immediately instead of delaying it.
+
+    Linux only.  The kernel drops back to delayed ACKs on its own, so this
+    is reasserted before each control message rather than set once.  Not
+    done on the bulk receive path, where delayed ACKs are what we want.
+    """
+    if _TCP_QUICKACK is not None:
+        with contextlib.suppress(OSError):
+            sock.setsockopt(socket.IPPROTO_TCP, _TCP_QUICKACK, 1)
 
 
 def send_msg(sock, text: str) -> None:
-    data = text.encode("utf-8")
-    length_prefix = struct.pack("!I", len(data))
-    sock.sendall(length_prefix + data)
+    send_bytes(sock, text.encode("utf-8"))
+
+
+def send_bytes(sock, data: bytes | bytearray) -> None:
+    """Send an already-encoded message payload with its length prefix."""
+    prefix = _LEN_PREFIX.pack(len(data))
+
+    # Gather prefix and payload into one send without copying the payload.
+    # sendmsg() is POSIX-only and, unlike sendall(), may send partially.
+    sendmsg = getattr(sock, "sendmsg", None)
+    if sendmsg is None:
+        sock.sendall(prefix + data)
+        return
+    sent = sendmsg((prefix, data))
+    if sent < len(prefix):
+        sock.sendall(prefix[sent:])
+        sock.sendall(data)
+    elif sent < len(prefix) + len(data):
+        sock.sendall(memoryview(data)[sent - len(prefix) :])
 
 
 def recv_msg(sock) -> str | None:
-    raw_len = _recv_exactly(sock, 4)
+    _quickack(sock)
+    raw_len = _recv_exactly(sock, _LEN_PREFIX.size)
     if raw_len is None:
         return None
-    msg_len = struct.unpack("!I", raw_len)[0]
+    (msg_len,) = _LEN_PREFIX.unpack(raw_len)
     if msg_len > MAX_MSG_SIZE:
         raise ValueError(
             f"Incoming message too large: {msg_len} bytes (max {MAX_MSG_SIZE})"
@@ -40,22 +109,84 @@ def recv_msg(sock) -> str | None:
         return None
     return raw_data.decode("utf-8")
 
+@contextlib.contextmanager
+def corked(sock):
+    """Hold back partial segments while a header and body are written.
+
+    With TCP_CORK set (Linux) the kernel only sends full segments, so a
+    short header goes out in the same packet as the start of the body
+    instead of on its own; clearing the flag flushes whatever is left.
+    Elsewhere this does nothing.
+    """
+    if _TCP_CORK is None:
+        yield
+        return
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, _TCP_CORK, 1)
+    except OSError:
+        yield
+        return
+    try:
+        yield
+    finally:
+        with contextlib.suppress(OSError):
+            sock.setsockopt(socket.IPPROTO_TCP, _TCP_CORK, 0)
+
+
 def send_file(sock, filepath: str) -> None:
-    if os.path.islink(filepath):
+    """Send the size of *filepath* as a message, then its contents.
+
+    Refuses a symlink.  The file is opened with O_NOFOLLOW and sized with
+    fstat(), so nothing can be swapped in between the check and the read.
+    """
+    if not _O_NOFOLLOW and os.path.islink(filepath):
         raise ValueError(f"Refusing to send symlink: {filepath}")
+    try:
+        fd = os.open(filepath, os.O_RDONLY | _O_NOFOLLOW | getattr(os, "O_BINARY", 0))
+    except OSError as e:
+        if e.errno in _SYMLINK_ERRNOS:
+            raise ValueError(f"Refusing to send symlink: {filepath}") from None
+        raise
 
-    filesize = os.path.getsize(filepath)
-    send_msg(sock, str(filesize))
+    # Bound the transfer by the advertised size: if the file grows while it
+    # is being sent, the receiver must not get bytes it isn't expecting.
+    with os.fdopen(fd, "rb") as f, corked(sock):
+        filesize = os.fstat(fd).st_size
+        send_msg(sock, str(filesize))
+        send_file_data(sock, f, filesize)
 
-    with open(filepath, "rb") as f:
-        try:
-            sock.sendfile(f)
-        except AttributeError:
-            while True:
-                chunk = f.read(BUFFER_SIZE)
-                if not chunk:
-                    break
-                sock.sendall(chunk)
+
+def send_file_data(
+    sock,
+    f,
+    filesize: int,
+    progress_callback: Callable[[int, int], None] | None = None,
+    cancel_event: threading.Event | None = None,
+) -> int:
+    """Stream *filesize* bytes of the open file *f* to the socket.
+
+    Uses socket.sendfile(), which copies page cache -> socket inside the
+    kernel where os.sendfile is available and falls back to a read/send
+    loop elsewhere.  Returns the number of bytes sent; this is short if the
+    file shrank or *cancel_event* was set.
+    """
+    # The whole file is read front to back exactly once: let the kernel use
+    # its largest readahead window.
+    if hasattr(os, "posix_fadvise"):
+        with contextlib.suppress(OSError, io.UnsupportedOperation):
+            os.posix_fadvise(f.fileno(), 0, filesize, os.POSIX_FADV_SEQUENTIAL)
+
+    sent = 0
+    while sent < filesize:
+        if cancel_event and cancel_event.is_set():
+            break
+        n = sock.sendfile(f, sent, min(SENDFILE_BLOCK_SIZE, filesize - sent))
+        if not n:
+            break
+        sent += n
+        if progress_callback:
+            progress_callback(sent, filesize)
+    return sent
 
 
 def recv_file(
@@ -78,19 +209,26 @@ def recv_file(
             prefix=f".{os.path.basename(filepath)}.",
             suffix=".part",
         )
+        # Progress callbacks usually hop onto the UI thread and wait for it,
+        # so report at most once per percent (never below BUFFER_SIZE) plus
+        # once on completion rather than after every recv.
+        report_step = max(BUFFER_SIZE, filesize // 100)
+        next_report = report_step
         with os.fdopen(fd, "wb") as f:
             fd = None
-            while received < filesize:
-                if cancel_event and cancel_event.is_set():
-                    break
-                chunk_size = min(BUFFER_SIZE, filesize - received)
-                chunk = _recv_exactly(sock, chunk_size)
-                if chunk is None:
-                    break
-                f.write(chunk)
-                received += len(chunk)
-                if progress_callback:
-                    progress_callback(received, filesize)
+            with _chunk_receiver(sock, f, filesize) as recv_chunk:
+                while received < filesize:
+                    if cancel_event and cancel_event.is_set():
+                        break
+                    n = recv_chunk(received, min(BULK_BUFFER_SIZE, filesize - received))
+                    if not n:
+                        break
+                    received += n
+                    if progress_callback and (
+                        received >= next_report or received == filesize
+                    ):
+                        progress_callback(received, filesize)
+                        next_report = received + report_step
         if received == filesize and tmp_path:
             os.replace(tmp_path, filepath)
             tmp_path = None
@@ -113,12 +251,109 @@ def recv_file(
     return received
 
 
-def _recv_exactly(sock, num_bytes: int) -> bytes | None:
-    """Read exactly *num_bytes* from the socket. Returns None on disconnect."""
-    data = bytearray()
-    while len(data) < num_bytes:
-        packet = sock.recv(min(BUFFER_SIZE, num_bytes - len(data)))
-        if not packet:
-            return None
-        data.extend(packet)
-    return bytes(data)
+@contextlib.contextmanager
+def _chunk_receiver(sock, f, filesize: int):
+    """Yield ``recv_chunk(offset, size) -> int`` that moves up to *size*
+    bytes from the socket into the file *f* at *offset*, returning 0 at EOF.
+
+    Large files are spliced through a pipe on Linux, so the data never
+    enters user space; elsewhere they are received straight into an mmap
+    of the file.  Small files go through one reusable scratch buffer.
+    """
+    if filesize >= MMAP_MIN_SIZE:
+        _preallocate(f.fileno(), filesize)
+
+    if filesize >= MMAP_MIN_SIZE and hasattr(os, "splice"):
+        import fcntl
+
+        pipe_r, pipe_w = os.pipe()
+        with contextlib.suppress(OSError):
+            fcntl.fcntl(pipe_w, fcntl.F_SETPIPE_SZ, BULK_BUFFER_SIZE)
+        try:
+            yield lambda offset, size: _splice_chunk(
+                sock, pipe_r, pipe_w, f.fileno(), size
+            )
+        finally:
+            os.close(pipe_r)
+            os.close(pipe_w)
+    elif filesize >= MMAP_MIN_SIZE:
+        # Size the file up front and receive straight into its mapping: the
+        # kernel copies into the page cache directly and there is no
+        # write() per chunk.
+        f.truncate(filesize)
+        mm = mmap.mmap(f.fileno(), filesize, access=mmap.ACCESS_WRITE)
+        view = memoryview(mm)
+        try:
+            yield lambda offset, size: sock.recv_into(view[offset:], size)
+        finally:
+            view.release()
+            mm.close()
+    else:
+        # recv_into fills the buffer in place, so no bytes object is created
+        # per chunk.
+        view = memoryview(bytearray(min(BULK_BUFFER_SIZE, filesize)))
+
+        def recv_chunk(offset: int, size: int) -> int:
+            n = sock.recv_into(view, size)
+            f.write(view[:n])
+            return n
+
+        try:
+            yield recv_chunk
+        finally:
+            view.release()
+
+
+def _preallocate(fd: int, size: int) -> None:
+    """Reserve the file's blocks up front so the filesystem allocates them
+    in one go (and contiguously) instead of extent by extent as data
+    arrives.  Best effort: a filesystem that can't do it just doesn't.
+    """
+    if hasattr(os, "posix_fallocate"):
+        with contextlib.suppress(OSError):
+            os.posix_fallocate(fd, 0, size)
+
+
+def _splice_chunk(sock, pipe_r: int, pipe_w: int, file_fd: int, size: int) -> int:
+    """Splice up to *size* bytes socket -> pipe -> file.  Returns 0 at EOF."""
+    while True:
+        try:
+            n = os.splice(sock.fileno(), pipe_w, size, flags=os.SPLICE_F_MOVE)
+            break
+        except BlockingIOError:
+            # Sockets with a timeout are non-blocking underneath, so wait for
+            # data the way recv() would.  poll() rather than select(), which
+            # fails for descriptors >= FD_SETSIZE (1024).
+            timeout = sock.gettimeout()
+            poller = select.poll()
+            poller.register(sock, select.POLLIN)
+            if not poller.poll(None if timeout is None else timeout * 1000):
+                raise TimeoutError("timed out") from None
+    moved = 0
+    while moved < n:
+        moved += os.splice(pipe_r, file_fd, n - moved, flags=os.SPLICE_F_MOVE)
+    return n
+
+
+def _recv_exactly(sock, num_bytes: int) -> bytearray | None:
+    """Read exactly *num_bytes* from the socket. Returns None on disconnect.
+
+    The filled buffer is returned as-is; callers only need a bytes-like
+    object, so copying it into an immutable bytes would be wasted work.
+    """
+    buf = bytearray(num_bytes)
+    if not _recv_exactly_into(sock, memoryview(buf)):
+        return None
+    return buf
+
+
+def _recv_exactly_into(sock, view: memoryview) -> bool:
+    """Fill *view* completely from the socket. Returns False on disconnect."""
+    offset = 0
+    total = len(view)
+    while offset < total:
+        n = sock.recv_into(view[offset:], min(BUFFER_SIZE, total - offset))
+        if not n:
+            return False
+        offset += n
+    return True
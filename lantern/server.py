@@ -2,41 +2,94 @@
 TCP file server — listens for incoming connections from other peers
 and handles LIST, DOWNLOAD, and UPLOAD commands.
 
-Each client connection is handled in its own thread.  A semaphore limits
-the number of concurrent handler threads to MAX_CONNECTIONS to prevent
-resource exhaustion from a flood of incoming connections.
+A connection may carry several LIST / DOWNLOAD commands back to back; a
+DOWNLOAD is answered with OK|<filesize> followed by the raw file bytes.
+
+LIST may carry the tag of the listing the peer already has:
+  LIST             -> OK|<listing>
+  LIST|<tag>       -> NOT_MODIFIED if the listing still has that tag,
+                      otherwise MODIFIED|<new tag>|<listing>
+
+Client connections are handled by a pool of MAX_CONNECTIONS reusable
+worker threads.  A semaphore turns away connections beyond that limit
+instead of letting them queue behind busy workers, which prevents resource
+exhaustion from a flood of incoming connections.
 
 Upload flow (with confirmation):
   1. Sender sends:  UPLOAD_REQUEST|<filename>|<filesize>
-  2. Server places a UploadRequest object on the pending_uploads queue and
+  2. Server appends an UploadRequest object to the pending_uploads deque and
      blocks on request.decision_event (timeout: UPLOAD_REQUEST_TIMEOUT).
-  3. The TUI dequeues the request, shows a confirmation modal, then calls
+  3. The TUI pops the request, shows a confirmation modal, then calls
      request.accept() or request.reject().
   4. Server resumes: if accepted it sends OK and receives the file; if
      rejected (or timed out) it sends ERROR and closes the connection.
   Legacy UPLOAD command is kept for CLI-mode compatibility.
 """
 
+import collections
+import errno
+import hashlib
 import os
-import queue
-import re
 import shutil
 import socket
+import stat
 import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 
 from typing_extensions import Callable
 
 from .config import SEPARATOR, SHARED_DIR, TCP_PORT
-from .protocol import recv_file, recv_msg, send_file, send_msg
+from .protocol import (
+    corked,
+    recv_file,
+    recv_msg,
+    send_bytes,
+    send_file_data,
+    send_msg,
+    tune_socket,
+)
 
 MAX_CONNECTIONS = 50
 UPLOAD_REQUEST_TIMEOUT = 60
 MAX_PENDING_UPLOADS = 20
-
-
-_WINDOWS_RESERVED = re.compile(
-    r"^(CON|PRN|AUX|NUL|COM[1-9]|LPT[1-9])(\.|$)", re.IGNORECASE
+# Seconds a connection may wait on its peer, between commands or mid-transfer,
+# before it is closed.  Longer than the client's POOL_IDLE_TIMEOUT, so a
+# pooled connection is normally retired by the client first.
+CONNECTION_IDLE_TIMEOUT = 60
+# Seconds a LIST reply is served from cache before the directory is rescanned.
+LIST_CACHE_TTL = 2.0
+
+# openat()-style access to the shared directory (POSIX).
+_DIR_FD_SUPPORTED = os.open in os.supports_dir_fd and hasattr(os, "O_DIRECTORY")
+_DOWNLOAD_OPEN_FLAGS = (
+    os.O_RDONLY | getattr(os, "O_NOFOLLOW", 0) | getattr(os, "O_NONBLOCK", 0)
+)
+# open() with O_NOFOLLOW reports a symlink as ELOOP (EMLINK on FreeBSD).
+_SYMLINK_ERRNOS = frozenset({errno.ELOOP, errno.EMLINK})
+
+# Fixed replies, encoded once.
+_SEP = SEPARATOR.encode("utf-8")
+_OK = b"OK"
+_OK_SEP = _OK + _SEP
+_MODIFIED_SEP = b"MODIFIED" + _SEP
+_NOT_MODIFIED = b"NOT_MODIFIED"
+_ERR_UNKNOWN_COMMAND = b"ERROR" + _SEP + b"Unknown command"
+_ERR_INTERNAL = b"ERROR" + _SEP + b"Internal server error"
+_ERR_UNSAFE_PATH = b"ERROR" + _SEP + b"Unsafe file path"
+_ERR_INVALID_SIZE = b"ERROR" + _SEP + b"Invalid file size"
+_ERR_NEGATIVE_SIZE = b"ERROR" + _SEP + b"File size must not be negative"
+_ERR_BUSY = b"ERROR" + _SEP + b"Server is busy, try again later"
+_ERR_DECLINED = b"ERROR" + _SEP + b"Upload declined"
+_ERR_NO_SPACE = b"ERROR" + _SEP + b"Not enough free disk space"
+
+
+_WINDOWS_RESERVED = frozenset(
+    {"CON", "PRN", "AUX", "NUL"}
+    | {f"COM{i}" for i in range(1, 10)}
+    | {f"LPT{i}" for i in range(1, 10)}
 )
 
 
@@ -52,7 +105,7 @@ def _safe_filename(filename: str) -> str:
     name = name.replace("\x00", "")
     if name in ("", ".", ".."):
         return "upload"
-    if _WINDOWS_RESERVED.match(name):
+    if name.split(".", 1)[0].upper() in _WINDOWS_RESERVED:
         return "upload"
     return name
 
@@ -70,7 +123,7 @@ def _has_enough_space(directory: str, required_bytes: int) -> bool:
         return False
 
 
-@dataclass
+@dataclass(slots=True)
 class UploadRequest:
     """Represents a pending upload awaiting user confirmation."""
 
@@ -98,6 +151,55 @@ class UploadRequest:
         self.decision_event.set()
 
 
+def _build_listing() -> bytes:
+    """Scan SHARED_DIR into the encoded listing sent in a LIST reply."""
+    # SHARED_DIR is created by FileServer; if it has since been removed
+    # there is simply nothing to list.  The upload handlers recreate it.
+    #
+    # DirEntry caches the file type from the directory read, so each entry
+    # costs at most one stat() for its size.  Symlinks are left out,
+    # matching what DOWNLOAD is willing to serve.
+    #
+    # The listing is encoded straight into one buffer rather than joining a
+    # list of strings and encoding the result.
+    listing = bytearray()
+    try:
+        with os.scandir(SHARED_DIR) as it:
+            for entry in it:
+                if entry.is_file(follow_symlinks=False):
+                    listing += entry.name.encode("utf-8")
+                    listing += _SEP
+                    listing += b"%d\n" % entry.stat().st_size
+    except FileNotFoundError:
+        listing.clear()
+
+    if listing.endswith(b"\n"):
+        del listing[-1]
+    return bytes(listing)
+
+
+@dataclass(slots=True, frozen=True)
+class _Listing:
+    """A scan of SHARED_DIR, encoded for both forms of LIST."""
+
+    scanned_at: float
+    # Digest of the listing; a peer that sends it back is told NOT_MODIFIED.
+    tag: str
+    reply: bytes
+    modified_reply: bytes
+
+    @classmethod
+    def scan(cls) -> "_Listing":
+        listing = _build_listing()
+        tag = hashlib.blake2b(listing, digest_size=8).hexdigest()
+        return cls(
+            scanned_at=time.monotonic(),
+            tag=tag,
+            reply=_OK_SEP + listing,
+            modified_reply=_MODIFIED_SEP + tag.encode("ascii") + _SEP + listing,
+        )
+
+
 class FileServer:
     """Multithreaded TCP server for file operations."""
 
@@ -105,10 +207,33 @@ class FileServer:
         self.port = port
         self._running = False
         self._sock: socket.socket | None = None
+        os.makedirs(SHARED_DIR, exist_ok=True)
+        # Downloads open files relative to this descriptor (openat), so the
+        # kernel does not re-walk SHARED_DIR's path for each request and a
+        # swapped-in symlink on the way cannot redirect them.  It is closed
+        # when the server is garbage collected rather than in stop(), since
+        # handler threads may still be using it then.
+        self._dir_fd: int | None = None
+        self._dir_fd_lock = threading.Lock()
+        if _DIR_FD_SUPPORTED:
+            self._dir_fd = os.open(SHARED_DIR, os.O_RDONLY | os.O_DIRECTORY)
+            weakref.finalize(self, os.close, self._dir_fd)
         self._semaphore = threading.Semaphore(MAX_CONNECTIONS)
-        self.pending_uploads: queue.Queue[UploadRequest] = queue.Queue(
-            maxsize=MAX_PENDING_UPLOADS
+        # The last LIST scan.
+        self._list_cache: _Listing | None = None
+        self._list_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(
+            max_workers=MAX_CONNECTIONS, thread_name_prefix="lantern-srv"
         )
+        # Open client connections, so stop() can unblock their workers.
+        self._connections: set[socket.socket] = set()
+        self._connections_lock = threading.Lock()
+        # append() / popleft() are atomic, so producers and the TUI share the
+        # deque without a lock.  The MAX_PENDING_UPLOADS check is a soft cap.
+        self.pending_uploads: collections.deque[UploadRequest] = collections.deque()
+        # Requests whose handler is waiting on a decision, including ones the
+        # TUI has already taken off pending_uploads, keyed by id().
+        self._awaiting_decision: dict[int, UploadRequest] = {}
 
     def start(self) -> None:
         self._running = True
@@ -120,9 +245,26 @@ class FileServer:
         if self._sock:
             self._sock.close()
 
+        # Pool workers are not daemon threads and are joined at interpreter
+        # exit, so wake any that are blocked on a peer or on a pending upload.
+        with self._connections_lock:
+            connections = list(self._connections)
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.pending_uploads.clear()
+        with self._connections_lock:
+            awaiting = list(self._awaiting_decision.values())
+        for request in awaiting:
+            request.reject()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
     def _accept_loop(self) -> None:
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        tune_socket(sock)
         try:
             sock.bind(("0.0.0.0", self.port))
             sock.listen(5)
@@ -140,6 +282,13 @@ class FileServer:
             except OSError:
                 break
 
+            # Replies are small framed messages; don't let Nagle hold them
+            # back waiting for an ACK.
+            try:
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except OSError:
+                pass
+
             if not self._semaphore.acquire(blocking=False):
                 try:
                     conn.close()
@@ -147,119 +296,222 @@ class FileServer:
                     pass
                 continue
 
-            handler = threading.Thread(
-                target=self._handle_client, args=(conn, addr), daemon=True
-            )
-            handler.start()
+            try:
+                self._pool.submit(self._handle_client, conn, addr)
+            except RuntimeError:
+                # The pool was shut down by stop() after accept() returned.
+                conn.close()
+                self._semaphore.release()
 
         self._sock.close()
 
     def _handle_client(self, conn: socket.socket, addr: tuple) -> None:
+        """Serve commands from one peer until it disconnects.
+
+        LIST and DOWNLOAD leave the connection open for further commands so
+        a peer can issue several of them without reconnecting; the upload
+        commands end the session once the transfer is done.  A peer that
+        stays silent for CONNECTION_IDLE_TIMEOUT is disconnected, so idle
+        connections don't hold on to worker threads.
+        """
+        with self._connections_lock:
+            self._connections.add(conn)
         try:
-            command_msg = recv_msg(conn)
-            if command_msg is None:
-                return
-
-            parts = command_msg.split(SEPARATOR)
-            cmd = parts[0].upper()
-
-            if cmd == "LIST":
-                self._handle_list(conn)
-            elif cmd == "DOWNLOAD" and len(parts) >= 2:
-                self._handle_download(conn, parts[1])
-            elif cmd == "UPLOAD_REQUEST" and len(parts) >= 3:
-                self._handle_upload_request(conn, addr[0], parts[1], parts[2])
-            elif cmd == "UPLOAD" and len(parts) >= 3:
-                self._handle_upload(conn, parts[1], parts[2])
-            else:
-                send_msg(conn, f"ERROR{SEPARATOR}Unknown command")
+            conn.settimeout(CONNECTION_IDLE_TIMEOUT)
+            while True:
+                try:
+                    command_msg = recv_msg(conn)
+                except socket.timeout:
+                    return
+                if command_msg is None:
+                    return
+
+                cmd, *args = command_msg.split(SEPARATOR)
+                command = _COMMANDS.get(cmd.upper())
+                if command is None or len(args) < command[0]:
+                    send_bytes(conn, _ERR_UNKNOWN_COMMAND)
+                    continue
+                _, max_args, handler = command
+                if not handler(self, conn, addr, *args[:max_args]):
+                    return
         except Exception:
             try:
-                send_msg(conn, f"ERROR{SEPARATOR}Internal server error")
+                send_bytes(conn, _ERR_INTERNAL)
             except Exception:
                 pass
         finally:
+            with self._connections_lock:
+                self._connections.discard(conn)
             conn.close()
             self._semaphore.release()
 
-    def _handle_list(self, conn: socket.socket) -> None:
-        os.makedirs(SHARED_DIR, exist_ok=True)
-
-        entries = []
-        for name in os.listdir(SHARED_DIR):
-            filepath = os.path.join(SHARED_DIR, name)
-            if os.path.isfile(filepath):
-                size = os.path.getsize(filepath)
-                entries.append(f"{name}{SEPARATOR}{size}")
+    def _handle_list(
+        self, conn: socket.socket, addr: tuple, tag: str | None = None
+    ) -> bool:
+        listing = self._listing()
+        if tag is None:
+            send_bytes(conn, listing.reply)
+        elif tag == listing.tag:
+            send_bytes(conn, _NOT_MODIFIED)
+        else:
+            send_bytes(conn, listing.modified_reply)
+        return True
+
+    def _listing(self) -> _Listing:
+        """Return the current LIST scan, rescanning at most every
+        LIST_CACHE_TTL seconds.
+
+        Every peer viewing our files polls LIST, so without the cache the
+        directory would be scanned once per peer per poll.  Uploads clear
+        the cache so received files show up straight away.
+        """
+        cached = self._list_cache
+        if cached is not None and time.monotonic() - cached.scanned_at < LIST_CACHE_TTL:
+            return cached
+        with self._list_lock:
+            # Another handler may have rebuilt it while we waited.
+            cached = self._list_cache
+            if (
+                cached is not None
+                and time.monotonic() - cached.scanned_at < LIST_CACHE_TTL
+            ):
+                return cached
+            self._list_cache = _Listing.scan()
+            return self._list_cache
+
+    def _open_download(self, path: str, dir_fd: int | None) -> int:
+        """Open *path* for a DOWNLOAD, relative to *dir_fd* if given.
+
+        A SHARED_DIR that has been deleted and recreated is still listed
+        (LIST scans by path), but _dir_fd points at the old directory.  So
+        a file that is not found is looked up once more after
+        _refresh_dir_fd(); the common case costs a single openat().
+        """
+        try:
+            return os.open(path, _DOWNLOAD_OPEN_FLAGS, dir_fd=dir_fd)
+        except FileNotFoundError:
+            if dir_fd is None:
+                raise
+        self._refresh_dir_fd()
+        return os.open(path, _DOWNLOAD_OPEN_FLAGS, dir_fd=dir_fd)
+
+    def _refresh_dir_fd(self) -> None:
+        """Point _dir_fd at SHARED_DIR again if the directory was replaced.
+
+        dup2() swaps the new directory in under the same descriptor number,
+        so handlers opening files meanwhile see either the old or the new
+        directory and nothing is left open.  Raises OSError if SHARED_DIR
+        does not exist.
+        """
+        with self._dir_fd_lock:
+            st, current = os.stat(SHARED_DIR), os.fstat(self._dir_fd)
+            if (st.st_dev, st.st_ino) == (current.st_dev, current.st_ino):
+                return
+            new_fd = os.open(SHARED_DIR, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.dup2(new_fd, self._dir_fd, inheritable=False)
+            finally:
+                os.close(new_fd)
 
-        listing = "\n".join(entries)
-        send_msg(conn, f"OK{SEPARATOR}{listing}")
+    def _handle_download(self, conn: socket.socket, addr: tuple, filename: str) -> bool:
+        """Send OK|<size> followed by the raw file bytes.
 
-    def _handle_download(self, conn: socket.socket, filename: str) -> None:
+        Returns False if the body was cut short, in which case the stream is
+        out of sync and the connection must not be reused.
+        """
         filename = _safe_filename(filename)
-        filepath = os.path.join(SHARED_DIR, filename)
+        if self._dir_fd is not None:
+            # The sanitized name has no directory part, so resolving it
+            # against the open directory cannot escape SHARED_DIR.
+            path, dir_fd = filename, self._dir_fd
+        else:
+            path, dir_fd = os.path.join(SHARED_DIR, filename), None
+            if not _is_safe_shared_path(path):
+                send_bytes(conn, _ERR_UNSAFE_PATH)
+                return True
+
+        # Open first and fstat() the descriptor: no separate existence or
+        # symlink checks, and nothing can be swapped in between the checks
+        # and the read.  O_NOFOLLOW fails on a symlink; O_NONBLOCK keeps a
+        # FIFO from blocking the open.
+        try:
+            fd = self._open_download(path, dir_fd)
+        except OSError as e:
+            if e.errno in _SYMLINK_ERRNOS:
+                send_bytes(conn, _ERR_UNSAFE_PATH)
+            else:
+                send_msg(conn, f"ERROR{SEPARATOR}File not found: {filename}")
+            return True
 
-        if not os.path.isfile(filepath):
+        st = os.fstat(fd)
+        if not stat.S_ISREG(st.st_mode):
+            os.close(fd)
             send_msg(conn, f"ERROR{SEPARATOR}File not found: {filename}")
-            return
-        if not _is_safe_shared_path(filepath):
-            send_msg(conn, f"ERROR{SEPARATOR}Unsafe file path")
-            return
+            return True
 
-        filesize = os.path.getsize(filepath)
-        send_msg(conn, f"OK{SEPARATOR}{filesize}")
-        send_file(conn, filepath)
+        with os.fdopen(fd, "rb") as f, corked(conn):
+            filesize = st.st_size
+            send_bytes(conn, _OK_SEP + b"%d" % filesize)
+            return send_file_data(conn, f, filesize) == filesize
 
     def _handle_upload_request(
         self,
         conn: socket.socket,
-        sender_ip: str,
+        addr: tuple,
         filename: str,
         filesize_str: str,
-    ) -> None:
+    ) -> bool:
         filename = _safe_filename(filename)
 
         try:
             filesize = int(filesize_str)
         except ValueError:
-            send_msg(conn, f"ERROR{SEPARATOR}Invalid file size")
-            return
+            send_bytes(conn, _ERR_INVALID_SIZE)
+            return False
 
         if filesize < 0:
-            send_msg(conn, f"ERROR{SEPARATOR}File size must not be negative")
-            return
+            send_bytes(conn, _ERR_NEGATIVE_SIZE)
+            return False
 
         request = UploadRequest(
-            sender_ip=sender_ip,
+            sender_ip=addr[0],
             filename=filename,
             filesize=filesize,
         )
+        if len(self.pending_uploads) >= MAX_PENDING_UPLOADS:
+            send_bytes(conn, _ERR_BUSY)
+            return False
+        with self._connections_lock:
+            self._awaiting_decision[id(request)] = request
         try:
-            self.pending_uploads.put_nowait(request)
-        except queue.Full:
-            send_msg(conn, f"ERROR{SEPARATOR}Server is busy, try again later")
-            return
-
-        decided = request.decision_event.wait(timeout=UPLOAD_REQUEST_TIMEOUT)
+            self.pending_uploads.append(request)
+            # stop() may have run before the request was registered.
+            if not self._running:
+                request.reject()
+            decided = request.decision_event.wait(timeout=UPLOAD_REQUEST_TIMEOUT)
+        finally:
+            with self._connections_lock:
+                del self._awaiting_decision[id(request)]
 
         if not decided or not request.accepted:
-            send_msg(conn, f"ERROR{SEPARATOR}Upload declined")
-            return
+            send_bytes(conn, _ERR_DECLINED)
+            return False
 
         try:
             os.makedirs(SHARED_DIR, exist_ok=True)
             if not _has_enough_space(SHARED_DIR, filesize):
-                send_msg(conn, f"ERROR{SEPARATOR}Not enough free disk space")
-                return
+                send_bytes(conn, _ERR_NO_SPACE)
+                return False
 
-            send_msg(conn, "OK")
+            send_bytes(conn, _OK)
             filepath = os.path.join(SHARED_DIR, filename)
             if not _is_safe_shared_path(filepath):
-                send_msg(conn, f"ERROR{SEPARATOR}Unsafe file path")
-                return
+                send_bytes(conn, _ERR_UNSAFE_PATH)
+                return False
             received = recv_file(conn, filepath, filesize, request.progress_callback)
 
             if received == filesize:
+                self._list_cache = None
                 request.transfer_success = True
                 send_msg(conn, f"OK{SEPARATOR}Received {filename} ({filesize} bytes)")
             else:
@@ -269,35 +521,50 @@ class FileServer:
                 )
         finally:
             request.transfer_done_event.set()
+        return False
 
     def _handle_upload(
-        self, conn: socket.socket, filename: str, filesize_str: str
-    ) -> None:
+        self, conn: socket.socket, addr: tuple, filename: str, filesize_str: str
+    ) -> bool:
         filename = _safe_filename(filename)
         os.makedirs(SHARED_DIR, exist_ok=True)
         filepath = os.path.join(SHARED_DIR, filename)
         if not _is_safe_shared_path(filepath):
-            send_msg(conn, f"ERROR{SEPARATOR}Unsafe file path")
-            return
+            send_bytes(conn, _ERR_UNSAFE_PATH)
+            return False
 
         try:
             filesize = int(filesize_str)
         except ValueError:
-            send_msg(conn, f"ERROR{SEPARATOR}Invalid file size")
-            return
+            send_bytes(conn, _ERR_INVALID_SIZE)
+            return False
 
         if filesize < 0:
-            send_msg(conn, f"ERROR{SEPARATOR}File size must not be negative")
-            return
+            send_bytes(conn, _ERR_NEGATIVE_SIZE)
+            return False
 
-        send_msg(conn, "OK")
+        send_bytes(conn, _OK)
 
         received = recv_file(conn, filepath, filesize)
 
         if received == filesize:
+            self._list_cache = None
             send_msg(conn, f"OK{SEPARATOR}Received {filename} ({filesize} bytes)")
         else:
             send_msg(
                 conn,
                 f"ERROR{SEPARATOR}Incomplete transfer: got {received}/{filesize} bytes",
             )
+        return False
+
+
+# Command name -> (required arguments, maximum arguments, handler).
+# Handlers are called with the connection, the peer's address and the
+# arguments, and return whether the connection stays open for further
+# commands.  Arguments beyond the maximum are ignored.
+_COMMANDS = {
+    "LIST": (0, 1, FileServer._handle_list),
+    "DOWNLOAD": (1, 1, FileServer._handle_download),
+    "UPLOAD_REQUEST": (2, 2, FileServer._handle_upload_request),
+    "UPLOAD": (2, 2, FileServer._handle_upload),
+}
@@ -2,19 +2,23 @@
 
 from __future__ import annotations
 
+import collections
 import os
-import queue
 import threading
+import time
 from datetime import datetime
 from pathlib import Path
 
+from rich.errors import MarkupError
 from rich.markup import escape as markup_escape
+from rich.text import Text
 from textual import work
 from textual.app import App, ComposeResult
 from textual.binding import Binding
 from textual.containers import Container, Horizontal, Vertical
 from textual.reactive import reactive
 from textual.screen import ModalScreen, Screen
+from textual.timer import Timer
 from textual.widgets import (
     Button,
     DataTable,
@@ -41,6 +45,18 @@ from .discovery import PeerDiscovery
 from .server import FileServer, UploadRequest
 
 CSS_FILE = os.path.join(os.path.dirname(__file__), "styles", "lantern.css")
+# Minimum seconds between progress bar redraws (~30 Hz).
+PROGRESS_UPDATE_INTERVAL = 1 / 30
+# Seconds from the first queued activity-log line to the flush; lines logged
+# in between are written to the RichLog in one go.
+LOG_FLUSH_INTERVAL = 0.016
+# Seconds to wait after an upload before refreshing the file lists, so that
+# consecutive uploads share one refresh.
+REFRESH_DEBOUNCE_DELAY = 0.5
+# "My shares" is rescanned at least every this many refresh ticks (once a
+# minute), even if SHARED_DIR's mtime is unchanged: rewriting a file in place
+# changes its size but not the directory's mtime.
+MY_FILES_FULL_SCAN_TICKS = 6
 CLASSIC_LOGO = (
     " _             _                \n"
     "| |   __ _ _ _| |_ ___ _ _ _ _  \n"
@@ -68,6 +84,9 @@ class TransferProgressScreen(ModalScreen):
         self.current_size = 0
         self.cancel_event = cancel_event
         self._completed = False
+        self._progress_bar: ProgressBar | None = None
+        self._status_label: Label | None = None
+        self._last_update = 0.0
 
     def compose(self) -> ComposeResult:
         with Container(id="upload-dialog"):
@@ -76,14 +95,29 @@ class TransferProgressScreen(ModalScreen):
             yield ProgressBar(total=self.total_size, id="progress-bar")
             yield Button("Cancel", variant="error", id="btn-cancel")
 
+    def on_mount(self) -> None:
+        self._progress_bar = self.query_one("#progress-bar", ProgressBar)
+        self._status_label = self.query_one("#transfer-status", Label)
+
     def update_progress(self, current: int) -> None:
-        """Update the progress bar and status."""
+        """Update the progress bar and status.
+
+        Redraws at most PROGRESS_UPDATE_INTERVAL apart, plus the final
+        update, so fast transfers don't spend their time re-rendering.
+        """
         if not self.is_mounted or self._completed:
             return
+        self.current_size = current
+        now = time.monotonic()
+        if (
+            current < self.total_size
+            and now - self._last_update < PROGRESS_UPDATE_INTERVAL
+        ):
+            return
+        self._last_update = now
         try:
-            self.current_size = current
-            progress_bar = self.query_one("#progress-bar", ProgressBar)
-            status_label = self.query_one("#transfer-status", Label)
+            progress_bar = self._progress_bar
+            status_label = self._status_label
 
             progress_bar.advance(current - progress_bar.progress)
             percent = (current / self.total_size * 100) if self.total_size > 0 else 100
@@ -296,6 +330,19 @@ class LanternApp(App):
         self.file_server = file_server
         self.tcp_port = tcp_port
         self.theme = "textual-dark"
+        # Shared-directory state from the last _refresh_my_files scan.
+        self._shared_dir_mtime_ns: int | None = None
+        self._my_files_ticks = 0
+        # Sorted (name, size) pairs last shown in #my-files-table.
+        self._my_files: list[tuple[str, int]] | None = None
+        self._local_totals: tuple[int, int] = (0, 0)
+        # peer_id -> its entry in #peer-list, kept in step by _poll_peers.
+        self._peer_index: dict[str, ListItem] = {}
+        # Debounce timer for _schedule_refresh.
+        self._pending_refresh_timer: Timer | None = None
+        # Pending (timestamp, message) activity-log lines; see _log / _flush_logs.
+        self._log_queue: collections.deque[tuple[str, str]] = collections.deque()
+        self._log_lock = threading.Lock()
 
     def compose(self) -> ComposeResult:
         yield Header()
@@ -390,7 +437,7 @@ class LanternApp(App):
         self._log(
             f"Lantern started  [bold #5dba6e]peer_id={PEER_ID}[/]  tcp_port={self.tcp_port}"
         )
-        self._log(f"Shared directory: [#7090a0]{SHARED_DIR}[/]")
+        self._log(f"Shared directory: [#7090a0]{markup_escape(str(SHARED_DIR))}[/]")
         self._log("Looking for peers on this local network...")
 
         if SHOW_WELCOME_SCREEN:
@@ -416,20 +463,9 @@ class LanternApp(App):
         except Exception:
             pass
 
-    def _local_file_totals(self) -> tuple[int, int]:
-        count = 0
-        total_size = 0
-        os.makedirs(SHARED_DIR, exist_ok=True)
-        for name in os.listdir(SHARED_DIR):
-            filepath = os.path.join(SHARED_DIR, name)
-            if os.path.isfile(filepath):
-                count += 1
-                total_size += os.path.getsize(filepath)
-        return count, total_size
-
     def _refresh_dashboard(self) -> None:
         peer_count = len(self.discovery.get_peers())
-        local_count, local_size = self._local_file_totals()
+        local_count, local_size = self._local_totals
         remote_count = len(self.remote_files)
 
         try:
@@ -483,9 +519,9 @@ class LanternApp(App):
         if query:
             filtered = [f for f in self.remote_files if query in f["name"].lower()]
 
+        # One add_rows() call refreshes the table once, not once per row.
         table.clear()
-        for f in filtered:
-            table.add_row(f["name"], format_size(f["size"]))
+        table.add_rows((f["name"], format_size(f["size"])) for f in filtered)
 
         empty_state.display = False
         search_label.display = bool(query and not filtered)
@@ -502,7 +538,7 @@ class LanternApp(App):
             summary.update(f"{len(self.remote_files)} files • {format_size(total_size)}")
 
         self.query_one("#status-files", Static).update(
-            f"Files {len(self.remote_files) + self._local_file_totals()[0]}"
+            f"Files {len(self.remote_files) + self._local_totals[0]}"
         )
         self.query_one("#status-transfers", Static).update(
             f"Transfers {self.active_transfers}"
@@ -515,9 +551,39 @@ class LanternApp(App):
         self._render_remote_files()
 
     def _log(self, message: str) -> None:
-        log_view = self.query_one("#log-view", RichLog)
+        """Queue a line for the activity log.
+
+        Safe to call from worker threads: lines are only queued here and
+        written to the RichLog in batches by _flush_logs on the UI thread.
+        The first line into an empty queue arms a one-shot flush, so nothing
+        runs while the log is idle.
+        """
         ts = datetime.now().strftime("%H:%M:%S")
-        log_view.write(f"[#506050]{ts}[/]  {message}")
+        with self._log_lock:
+            arm = not self._log_queue
+            self._log_queue.append((ts, message))
+        if arm:
+            # call_later posts to the app's message queue, so it is safe from
+            # any thread; the timer itself is then set on the UI thread.
+            self.call_later(self.set_timer, LOG_FLUSH_INTERVAL, self._flush_logs)
+
+    def _flush_logs(self) -> None:
+        with self._log_lock:
+            batch = list(self._log_queue)
+            self._log_queue.clear()
+        log_view = self.query_one("#log-view", RichLog)
+        lines = []
+        for ts, message in batch:
+            # Parse each message on its own so one bad entry can't drop the
+            # batch; one that fails is shown as it was written.
+            try:
+                text = Text.from_markup(message)
+            except MarkupError:
+                text = Text(message)
+            # RichLog only highlights str input, so do it here.
+            line = Text.assemble((ts, "#506050"), "  ", text)
+            lines.append(log_view.highlighter(line))
+        log_view.write(Text("\n").join(lines))
 
     def show_notification(self, message: str, notification_type: str = "info") -> None:
         notification = Notification(message, notification_type)
@@ -528,14 +594,7 @@ class LanternApp(App):
         peer_list = self.query_one("#peer-list", ListView)
 
         current_ids = {p["peer_id"] for p in peers}
-
-        existing_items = list(peer_list.children)
-        existing_ids = set()
-        for item in existing_items:
-            pid = getattr(item, "peer_data_id", None)
-            if pid:
-                existing_ids.add(pid)
-
+        existing_ids = self._peer_index.keys()
         if current_ids == existing_ids:
             return
 
@@ -547,21 +606,25 @@ class LanternApp(App):
                     f"([#7090a0]{markup_escape(p['ip'])}:{p['tcp_port']}[/])"
                 )
 
+        # Patch the list in place: only lost peers are removed and only new
+        # ones mounted, so existing entries (and the highlight) stay put.
         for pid in existing_ids - current_ids:
-            self._log(f"[#c26068]Lost[/] peer [#7090a0]{pid}[/]")
+            self._log(f"[#c26068]Lost[/] peer [#7090a0]{markup_escape(pid)}[/]")
+            self._peer_index.pop(pid).remove()
 
-        peer_list.clear()
         self.query_one("#peers-hint", Static).display = not bool(peers)
         for p in peers:
+            if p["peer_id"] in existing_ids:
+                continue
             label = Static(
                 f"[#5dba6e]●[/] [bold #5dba6e]{markup_escape(p['hostname'])}[/]\n"
                 f"  [#7090a0]{markup_escape(p['ip'])}:{p['tcp_port']}[/]",
                 classes="peer-entry",
             )
             item = ListItem(label)
-            item.peer_data_id = p["peer_id"]  # type: ignore[attr-defined]
             item.peer_data = p  # type: ignore[attr-defined]
             peer_list.append(item)
+            self._peer_index[p["peer_id"]] = item
 
     def on_list_view_selected(self, event: ListView.Selected) -> None:
         item = event.item
@@ -589,8 +652,8 @@ class LanternApp(App):
 
     def _poll_upload_requests(self) -> None:
         try:
-            request = self.file_server.pending_uploads.get_nowait()
-        except queue.Empty:
+            request = self.file_server.pending_uploads.popleft()
+        except IndexError:
             return
         self._log(
             f"[#c4944a]Incoming upload request[/] from "
@@ -648,7 +711,7 @@ class LanternApp(App):
                             progress_screen.mark_complete, False, "Transfer incomplete"
                         )
                     self.call_from_thread(self._adjust_active_transfers, -1)
-                    self.call_from_thread(self._refresh_my_files)
+                    self.call_from_thread(self._refresh_my_files, force=True)
 
                 threading.Thread(target=_watch_completion, daemon=True).start()
                 request.accept(progress_callback=progress_callback)
@@ -665,13 +728,12 @@ class LanternApp(App):
                             f"Received {request.filename}",
                             "success",
                         )
-                        self.call_from_thread(
-                            self._log,
+                        self._log(
                             f"[#5dba6e]Received[/] [bold]{markup_escape(request.filename)}[/] "
                             f"({format_size(request.filesize)})",
                         )
                     self.call_from_thread(self._adjust_active_transfers, -1)
-                    self.call_from_thread(self._refresh_my_files)
+                    self.call_from_thread(self._refresh_my_files, force=True)
 
                 threading.Thread(target=_notify_done, daemon=True).start()
                 request.accept()
@@ -683,17 +745,69 @@ class LanternApp(App):
                 f"[#5dba6e]{markup_escape(request.sender_ip)}[/]"
             )
 
-    def _refresh_my_files(self) -> None:
+    @work(thread=True, exclusive=True, group="my-files")
+    def _refresh_my_files(self, force: bool = False) -> None:
+        """Rescan SHARED_DIR off the UI thread, which a slow or network
+        filesystem would otherwise stall.
+
+        Skipped when the directory's mtime is unchanged, i.e. nothing was
+        added, removed or renamed since the last scan, unless *force* is set
+        or MY_FILES_FULL_SCAN_TICKS ticks have passed.  The table is only
+        redrawn when the names or sizes actually changed.
+        """
+        os.makedirs(SHARED_DIR, exist_ok=True)
+        mtime_ns = os.stat(SHARED_DIR).st_mtime_ns
+        self._my_files_ticks += 1
+        if (
+            not force
+            and mtime_ns == self._shared_dir_mtime_ns
+            and self._my_files_ticks < MY_FILES_FULL_SCAN_TICKS
+        ):
+            return
+        self._my_files_ticks = 0
+
+        files = []
+        with os.scandir(SHARED_DIR) as it:
+            for entry in it:
+                # Count only what LIST offers: symlinks are not served.
+                if entry.is_file(follow_symlinks=False):
+                    files.append((entry.name, entry.stat().st_size))
+        files.sort()
+        self._shared_dir_mtime_ns = mtime_ns
+        if files == self._my_files:
+            return
+        self._my_files = files
+        rows = [(name, format_size(size)) for name, size in files]
+        totals = (len(files), sum(size for _, size in files))
+        self.call_from_thread(self._apply_my_files, rows, totals)
+
+    def _apply_my_files(
+        self, rows: list[tuple[str, str]], totals: tuple[int, int]
+    ) -> None:
         table = self.query_one("#my-files-table", DataTable)
         table.clear()
-        os.makedirs(SHARED_DIR, exist_ok=True)
-        for name in sorted(os.listdir(SHARED_DIR)):
-            filepath = os.path.join(SHARED_DIR, name)
-            if os.path.isfile(filepath):
-                size = os.path.getsize(filepath)
-                table.add_row(name, format_size(size))
+        table.add_rows(rows)
+        self._local_totals = totals
         self._refresh_dashboard()
 
+    def _schedule_refresh(self) -> None:
+        """Refresh the local and remote file lists once, shortly.
+
+        Each call pushes the refresh back, so a run of back-to-back uploads
+        ends in a single LIST round trip instead of one per file.
+        """
+        if self._pending_refresh_timer is not None:
+            self._pending_refresh_timer.stop()
+        self._pending_refresh_timer = self.set_timer(
+            REFRESH_DEBOUNCE_DELAY, self._do_combined_refresh
+        )
+
+    def _do_combined_refresh(self) -> None:
+        self._pending_refresh_timer = None
+        self._refresh_my_files(force=True)
+        if self.selected_peer:
+            self._refresh_remote_files()
+
     @work(thread=True)
     def _refresh_remote_files(self) -> None:
         peer = self.selected_peer
@@ -704,19 +818,20 @@ class LanternApp(App):
             files = fetch_file_list(peer["ip"], peer["tcp_port"])
             self.app.call_from_thread(self._update_remote_table, files)
         except Exception as e:
-            self.app.call_from_thread(
-                self._log,
+            self._log(
                 f"[#c26068]Error[/] listing files from "
                 f"[#5dba6e]{markup_escape(peer['hostname'])}[/]: {markup_escape(str(e))}",
             )
 
     def _update_remote_table(self, files: list[dict]) -> None:
-        self.remote_files = files
-        table = self.query_one("#remote-files-table", DataTable)
-        table.clear()
-        self._render_remote_files()
         if not files and self.selected_peer:
             self._log("Selected peer is online, but it has no shared files yet.")
+        # Re-fetching from a peer whose files haven't changed is the common
+        # case; the table and dashboard already show this listing.
+        if files == self.remote_files:
+            return
+        self.remote_files = files
+        self._render_remote_files()
         self._refresh_dashboard()
 
     def action_show_help(self) -> None:
@@ -738,7 +853,7 @@ class LanternApp(App):
         self.exit()
 
     def action_refresh_files(self) -> None:
-        self._refresh_my_files()
+        self._refresh_my_files(force=True)
         if self.selected_peer:
             self._refresh_remote_files()
             self._log(
@@ -770,8 +885,7 @@ class LanternApp(App):
 
     @work(thread=True)
     def _do_upload_async(self, peer: dict, filepath: str) -> None:
-        self.app.call_from_thread(
-            self._log,
+        self._log(
             f"Requesting upload of [bold]{markup_escape(os.path.basename(filepath))}[/] to "
             f"[#5dba6e]{markup_escape(peer['hostname'])}[/]...",
         )
@@ -816,24 +930,17 @@ class LanternApp(App):
                     f"Complete: {format_size(filesize)}",
                 )
 
-            self.app.call_from_thread(
-                self._log,
-                f"[#5dba6e]Success:[/] {msg}",
-            )
+            self._log(f"[#5dba6e]Success:[/] {markup_escape(msg)}")
             self.app.call_from_thread(
                 self.show_notification,
                 f"Uploaded {os.path.basename(filepath)}",
                 "success",
             )
-            self.app.call_from_thread(self._refresh_my_files)
-            self._refresh_remote_files()
+            self.app.call_from_thread(self._schedule_refresh)
         except Exception as e:
             if progress_screen:
                 self.app.call_from_thread(progress_screen.mark_complete, False, str(e))
-            self.app.call_from_thread(
-                self._log,
-                f"[#c26068]Upload failed:[/] {e}",
-            )
+            self._log(f"[#c26068]Upload failed:[/] {markup_escape(str(e))}")
             self.app.call_from_thread(
                 self.show_notification,
                 f"Upload failed: {e}",
@@ -875,8 +982,7 @@ class LanternApp(App):
     def _do_download_async(
         self, peer: dict, filename: str, filesize: int | None = None
     ) -> None:
-        self.app.call_from_thread(
-            self._log,
+        self._log(
             f"Downloading [bold]{markup_escape(filename)}[/] from [#5dba6e]{markup_escape(peer['hostname'])}[/]...",
         )
         self.app.call_from_thread(
@@ -918,8 +1024,7 @@ class LanternApp(App):
                     True,
                     f"Complete: {format_size(received)}",
                 )
-            self.app.call_from_thread(
-                self._log,
+            self._log(
                 f"[#5dba6e]Downloaded[/] {filename} "
                 f"({format_size(received)}) -> [#7090a0]{dest}[/]",
             )
@@ -928,14 +1033,11 @@ class LanternApp(App):
                 f"Downloaded {filename}",
                 "success",
             )
-            self.app.call_from_thread(self._refresh_my_files)
+            self.app.call_from_thread(self._refresh_my_files, force=True)
         except Exception as e:
             if progress_screen:
                 self.app.call_from_thread(progress_screen.mark_complete, False, str(e))
-            self.app.call_from_thread(
-                self._log,
-                f"[#c26068]Download failed:[/] {e}",
-            )
+            self._log(f"[#c26068]Download failed:[/] {markup_escape(str(e))}")
             self.app.call_from_thread(
                 self.show_notification,
                 f"Download failed: {e}",
@@ -978,7 +1080,7 @@ class LanternApp(App):
         elif cmd == "peers":
             self._cmd_peers()
         elif cmd == "myfiles":
-            self._refresh_my_files()
+            self._refresh_my_files(force=True)
             self._log("Refreshed local file list.")
         elif cmd == "list" and len(tokens) >= 2:
             result = self._parse_target(tokens[1])
@@ -1002,7 +1104,10 @@ class LanternApp(App):
         elif cmd in ("quit", "exit"):
             self.action_quit_app()
         else:
-            self._log(f"[#c4944a]Unknown command:[/] {raw}  (press F1 for help)")
+            self._log(
+                f"[#c4944a]Unknown command:[/] {markup_escape(raw)}"
+                "  (press F1 for help)"
+            )
 
     def _parse_target(self, target: str) -> tuple[str, int] | None:
         if ":" in target:
@@ -1011,7 +1116,7 @@ class LanternApp(App):
                 port = int(port_str)
             except ValueError:
                 self._log(
-                    f"[#c26068]Error:[/] Invalid port '{port_str}' — must be an integer."
+                    f"[#c26068]Error:[/] Invalid port '{markup_escape(port_str)}' — must be an integer."
                 )
                 return None
             if not (1 <= port <= 65535):
@@ -1036,20 +1141,14 @@ class LanternApp(App):
         try:
             files = fetch_file_list(host, port)
             if not files:
-                self.app.call_from_thread(
-                    self._log, f"No files on [#7090a0]{host}:{port}[/]"
-                )
+                self._log(f"No files on [#7090a0]{host}:{port}[/]")
             else:
                 for f in files:
-                    self.app.call_from_thread(
-                        self._log,
+                    self._log(
                         f"  {markup_escape(f['name'])}  [#7090a0]{format_size(f['size'])}[/]",
                     )
         except Exception as e:
-            self.app.call_from_thread(
-                self._log,
-                f"[#c26068]Error:[/] {e}",
-            )
+            self._log(f"[#c26068]Error:[/] {markup_escape(str(e))}")
 
 
 def run_tui(discovery: PeerDiscovery, file_server: FileServer, tcp_port: int) -> None:
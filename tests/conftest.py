@@ -0,0 +1,54 @@
+"""
+Shared pytest configuration.
+"""
+
+import os
+import tempfile
+
+import pytest
+
+# RAM-backed directory for tmp_path on Linux.
+_SHM_DIR = "/dev/shm"
+_saved_tempdir = pytest.StashKey[str | None]()
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--benchmarks",
+        action="store_true",
+        help="also run timing tests marked with @pytest.mark.benchmark",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    # Wall-clock assertions are flaky on loaded machines, so they are opt-in.
+    if config.getoption("--benchmarks"):
+        return
+    skip = pytest.mark.skip(reason="timing test; pass --benchmarks to run")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+def pytest_configure(config):
+    """Register markers, and put tmp_path under /dev/shm so transfer tests
+    don't touch the disk.
+
+    The latter only when TMPDIR isn't set explicitly, so a chosen temp
+    directory still wins.  tmp_path_factory asks tempfile for its base
+    directory lazily, so setting it here is early enough.
+    """
+    config.addinivalue_line(
+        "markers", "benchmark: timing test, only run with --benchmarks"
+    )
+
+    if "TMPDIR" in os.environ:
+        return
+    if os.path.isdir(_SHM_DIR) and os.access(_SHM_DIR, os.W_OK | os.X_OK):
+        config.stash[_saved_tempdir] = tempfile.tempdir
+        tempfile.tempdir = _SHM_DIR
+
+
+def pytest_unconfigure(config):
+    if _saved_tempdir in config.stash:
+        tempfile.tempdir = config.stash[_saved_tempdir]
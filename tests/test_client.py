@@ -2,7 +2,68 @@
 Tests for client.py — format_size and core API helpers.
 """
 
-from lantern.client import format_size
+import shutil
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+from lantern import client, server
+from lantern.client import do_download_many, fetch_file_list, format_size
+from lantern.protocol import recv_msg, send_msg
+
+
+def serve_once(reply: str, connections: int = 1) -> tuple[int, threading.Thread]:
+    """Answer a single request per connection on a loopback port with *reply*.
+
+    Each connection is closed after its reply, like a peer that does not
+    keep connections open.
+    """
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(1)
+    port = listener.getsockname()[1]
+
+    def handler():
+        try:
+            for _ in range(connections):
+                conn, _ = listener.accept()
+                with conn:
+                    recv_msg(conn)
+                    send_msg(conn, reply)
+        finally:
+            listener.close()
+
+    t = threading.Thread(target=handler, daemon=True)
+    t.start()
+    return port, t
+
+
+@pytest.fixture
+def file_server(tmp_path, monkeypatch):
+    """A FileServer sharing tmp_path/"remote", downloading into tmp_path/"local"."""
+    remote = tmp_path / "remote"
+    local = tmp_path / "local"
+    remote.mkdir()
+    local.mkdir()
+    monkeypatch.setattr(server, "SHARED_DIR", str(remote))
+    monkeypatch.setattr(client, "SHARED_DIR", str(local))
+
+    probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+
+    srv = server.FileServer(port=port)
+    srv.start()
+    deadline = time.monotonic() + 5
+    while srv._sock is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    yield port, remote, local
+    srv.stop()
+    client.close_idle_connections()
 
 
 class TestFormatSize:
@@ -24,3 +85,213 @@ class TestFormatSize:
 
     def test_terabytes(self):
         assert format_size(1024**4) == "1.0 TB"
+
+    def test_beyond_terabytes_stays_in_terabytes(self):
+        assert format_size(1024**5) == "1024.0 TB"
+
+    def test_just_below_unit_boundary(self):
+        assert format_size(1024 * 1024 - 1) == "1024.0 KB"
+
+    def test_float_input(self):
+        assert format_size(1536.0) == "1.5 KB"
+
+
+class TestFetchFileList:
+    def test_parses_listing(self):
+        port, t = serve_once("OK<SEP>a.txt<SEP>12\nnotes.md<SEP>0\nbig.iso<SEP>4096")
+        files = fetch_file_list("127.0.0.1", port)
+        t.join(timeout=5)
+        assert files == [
+            {"name": "a.txt", "size": 12},
+            {"name": "notes.md", "size": 0},
+            {"name": "big.iso", "size": 4096},
+        ]
+
+    def test_empty_listing(self):
+        port, t = serve_once("OK<SEP>")
+        assert fetch_file_list("127.0.0.1", port) == []
+        t.join(timeout=5)
+
+    def test_lists_server_directory(self, file_server):
+        port, remote, _ = file_server
+        (remote / "a.txt").write_bytes(b"alpha")
+        (remote / "héllo.md").write_bytes(b"")
+        (remote / "subdir").mkdir()
+
+        files = fetch_file_list("127.0.0.1", port)
+
+        assert sorted(files, key=lambda f: f["name"]) == [
+            {"name": "a.txt", "size": 5},
+            {"name": "héllo.md", "size": 0},
+        ]
+
+    def test_lists_empty_server_directory(self, file_server):
+        port, _, _ = file_server
+        assert fetch_file_list("127.0.0.1", port) == []
+
+    def test_reuses_connection(self, file_server):
+        port, _, _ = file_server
+        fetch_file_list("127.0.0.1", port)
+        (sock,) = [s for _, s in client._idle_connections[("127.0.0.1", port)]]
+
+        fetch_file_list("127.0.0.1", port)
+
+        assert [s for _, s in client._idle_connections[("127.0.0.1", port)]] == [sock]
+
+    def test_surplus_idle_connections_are_closed(self):
+        pairs = [socket.socketpair() for _ in range(client.POOL_MAX_IDLE_PER_PEER + 2)]
+        try:
+            for sock, _ in pairs:
+                client._checkin("127.0.0.1", 1, sock)
+
+            kept = [s for _, s in client._idle_connections[("127.0.0.1", 1)]]
+            assert kept == [s for s, _ in pairs[-client.POOL_MAX_IDLE_PER_PEER :]]
+            assert all(s.fileno() == -1 for s, _ in pairs[:2])
+        finally:
+            client.close_idle_connections()
+            for a, b in pairs:
+                a.close()
+                b.close()
+
+    def test_expired_connections_are_closed_on_checkin(self, monkeypatch):
+        (old, old_peer), (new, new_peer) = socket.socketpair(), socket.socketpair()
+        try:
+            client._checkin("127.0.0.1", 1, old)
+            monkeypatch.setattr(
+                client.time,
+                "monotonic",
+                lambda now=time.monotonic(): now + client.POOL_IDLE_TIMEOUT,
+            )
+            client._checkin("127.0.0.1", 2, new)
+
+            assert old.fileno() == -1
+            assert ("127.0.0.1", 1) not in client._idle_connections
+        finally:
+            client.close_idle_connections()
+            for sock in (old, old_peer, new, new_peer):
+                sock.close()
+
+    def test_reconnects_when_pooled_connection_was_closed(self):
+        port, t = serve_once("OK<SEP>a.txt<SEP>1", connections=2)
+        try:
+            assert len(fetch_file_list("127.0.0.1", port)) == 1
+            # The server has hung up on the pooled connection by now.
+            time.sleep(0.05)
+            assert len(fetch_file_list("127.0.0.1", port)) == 1
+        finally:
+            client.close_idle_connections()
+        t.join(timeout=5)
+
+    def test_changed_listing_is_resent(self, file_server, monkeypatch):
+        port, remote, _ = file_server
+        monkeypatch.setattr(server, "LIST_CACHE_TTL", 0)
+        (remote / "a.txt").write_bytes(b"alpha")
+        fetch_file_list("127.0.0.1", port)
+        (remote / "a.txt").write_bytes(b"alphabet")
+
+        assert fetch_file_list("127.0.0.1", port) == [{"name": "a.txt", "size": 8}]
+
+
+class TestDownloadMany:
+    def test_downloads_all_files_over_one_connection(self, file_server):
+        port, remote, local = file_server
+        (remote / "a.txt").write_bytes(b"alpha")
+        (remote / "b.bin").write_bytes(bytes(range(256)) * 10)
+        (remote / "empty").write_bytes(b"")
+
+        results = do_download_many("127.0.0.1", port, ["a.txt", "b.bin", "empty"])
+
+        assert [r[1] for r in results] == [5, 2560, 0]
+        for name in ("a.txt", "b.bin", "empty"):
+            assert (local / name).read_bytes() == (remote / name).read_bytes()
+
+    def test_missing_file_raises(self, file_server):
+        port, remote, _ = file_server
+        (remote / "a.txt").write_bytes(b"alpha")
+
+        with pytest.raises(RuntimeError, match="File not found"):
+            do_download_many("127.0.0.1", port, ["a.txt", "missing.txt"])
+
+    def test_symlink_is_refused(self, file_server):
+        port, remote, _ = file_server
+        (remote / "real.txt").write_bytes(b"alpha")
+        (remote / "link.txt").symlink_to(remote / "real.txt")
+
+        with pytest.raises(RuntimeError, match="Unsafe file path"):
+            do_download_many("127.0.0.1", port, ["link.txt"])
+
+    def test_directory_is_not_found(self, file_server):
+        port, remote, _ = file_server
+        (remote / "subdir").mkdir()
+
+        with pytest.raises(RuntimeError, match="File not found"):
+            do_download_many("127.0.0.1", port, ["subdir"])
+
+    def test_reset_mid_batch_is_not_retried(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(client, "SHARED_DIR", str(tmp_path))
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+        port = listener.getsockname()[1]
+        reconnected = []
+
+        def handler():
+            with listener:
+                conn, _ = listener.accept()
+                with conn:
+                    recv_msg(conn)
+                    send_msg(conn, "OK<SEP>a.txt<SEP>5")
+                    recv_msg(conn)
+                    send_msg(conn, "OK<SEP>5")
+                    conn.sendall(b"alpha")
+                    recv_msg(conn)
+                    # Close with an RST instead of a FIN.
+                    conn.setsockopt(
+                        socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0)
+                    )
+                listener.settimeout(0.5)
+                try:
+                    listener.accept()[0].close()
+                    reconnected.append(True)
+                except TimeoutError:
+                    pass
+
+        t = threading.Thread(target=handler, daemon=True)
+        t.start()
+        progress = []
+        try:
+            # Leaves the connection pooled, so the batch below reuses it.
+            fetch_file_list("127.0.0.1", port)
+            with pytest.raises(ConnectionResetError):
+                do_download_many(
+                    "127.0.0.1",
+                    port,
+                    ["a.txt", "b.txt"],
+                    progress_callback=lambda c, t: progress.append((c, t)),
+                )
+        finally:
+            client.close_idle_connections()
+        t.join(timeout=5)
+
+        assert not reconnected
+        assert progress.count((5, 5)) == 1
+        assert (tmp_path / "a.txt").read_bytes() == b"alpha"
+
+    def test_shared_directory_recreated(self, file_server, monkeypatch):
+        port, remote, local = file_server
+        monkeypatch.setattr(server, "LIST_CACHE_TTL", 0)
+        (remote / "a.txt").write_bytes(b"alpha")
+        do_download_many("127.0.0.1", port, ["a.txt"])
+
+        for content in (b"beta", b"gamma"):
+            shutil.rmtree(remote)
+            with pytest.raises(RuntimeError, match="File not found"):
+                do_download_many("127.0.0.1", port, ["a.txt"])
+            remote.mkdir()
+            (remote / "b.txt").write_bytes(content)
+
+            assert fetch_file_list("127.0.0.1", port) == [
+                {"name": "b.txt", "size": len(content)}
+            ]
+            do_download_many("127.0.0.1", port, ["b.txt"])
+            assert (local / "b.txt").read_bytes() == content
@@ -0,0 +1,144 @@
+"""
+Tests for discovery.py — beacon parsing, peer expiry and broadcast addresses.
+"""
+
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+from lantern import discovery as discovery_module
+from lantern.discovery import PeerDiscovery, _linux_broadcast_addresses
+
+
+@pytest.fixture
+def discovery():
+    """A PeerDiscovery that is never started, so no sockets or threads."""
+    return PeerDiscovery(tcp_port=5001)
+
+
+class TestHandleBeacon:
+    def test_valid_beacon_adds_peer(self, discovery):
+        discovery._handle_beacon(b"LANTERN_DISCOVER:abcd1234:5002:host", "10.0.0.2")
+
+        assert discovery.get_peers() == [
+            {
+                "peer_id": "abcd1234",
+                "ip": "10.0.0.2",
+                "hostname": "host",
+                "tcp_port": 5002,
+            }
+        ]
+
+    def test_hostname_keeps_colons(self, discovery):
+        discovery._handle_beacon(b"LANTERN_DISCOVER:abcd1234:5002:a:b:c", "10.0.0.2")
+
+        (peer,) = discovery.get_peers()
+        assert peer["hostname"] == "a:b:c"
+
+    def test_repeated_beacon_updates_peer(self, discovery):
+        discovery._handle_beacon(b"LANTERN_DISCOVER:abcd1234:5002:host", "10.0.0.2")
+        discovery._handle_beacon(b"LANTERN_DISCOVER:abcd1234:5003:host", "10.0.0.3")
+
+        (peer,) = discovery.get_peers()
+        assert (peer["ip"], peer["tcp_port"]) == ("10.0.0.3", 5003)
+
+    @pytest.mark.parametrize(
+        "raw",
+        [
+            b"",
+            b"SOMETHING_ELSE:abcd1234:5002:host",
+            b"LANTERN_DISCOVER:abcd1234:5002",
+            b"LANTERN_DISCOVER:abcd1234:port:host",
+            b"LANTERN_DISCOVER:abcd1234:0:host",
+            b"LANTERN_DISCOVER:abcd1234:65536:host",
+            b"LANTERN_DISCOVER:\xff\xfe:5002:host",
+            b"LANTERN_DISCOVER:abcd1234:5002:\xff\xfe",
+        ],
+    )
+    def test_malformed_beacon_is_ignored(self, discovery, raw):
+        discovery._handle_beacon(raw, "10.0.0.2")
+
+        assert discovery.get_peers() == []
+
+    def test_own_beacon_is_ignored(self, discovery):
+        discovery._handle_beacon(discovery._beacon_data, "10.0.0.1")
+
+        assert discovery.get_peers() == []
+
+
+class TestExpiry:
+    def _age(self, discovery, peer_id, seconds):
+        with discovery._lock:
+            discovery._peers[peer_id]["last_seen"] -= int(seconds * 1_000_000_000)
+
+    def test_stale_peer_is_evicted(self, discovery):
+        discovery._handle_beacon(b"LANTERN_DISCOVER:stale:5002:old", "10.0.0.2")
+        discovery._handle_beacon(b"LANTERN_DISCOVER:fresh:5002:new", "10.0.0.3")
+        self._age(discovery, "stale", discovery_module.PEER_TIMEOUT + 1)
+
+        discovery._evict_expired()
+
+        assert [p["peer_id"] for p in discovery.get_peers()] == ["fresh"]
+
+    def test_recent_peer_is_kept(self, discovery):
+        discovery._handle_beacon(b"LANTERN_DISCOVER:abcd1234:5002:host", "10.0.0.2")
+        self._age(discovery, "abcd1234", discovery_module.PEER_TIMEOUT - 1)
+
+        discovery._evict_expired()
+
+        assert len(discovery.get_peers()) == 1
+
+    def test_expirer_loop_evicts_in_background(self, discovery, monkeypatch):
+        monkeypatch.setattr(discovery_module, "PEER_TIMEOUT", 0.02)
+        monkeypatch.setattr(discovery_module, "_PEER_TIMEOUT_NS", 20_000_000)
+        discovery._handle_beacon(b"LANTERN_DISCOVER:abcd1234:5002:host", "10.0.0.2")
+
+        discovery._running = True
+        thread = threading.Thread(target=discovery._expirer_loop, daemon=True)
+        thread.start()
+        try:
+            deadline = time.monotonic() + 2
+            while discovery.get_peers() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert discovery.get_peers() == []
+        finally:
+            discovery._running = False
+            thread.join(timeout=2)
+
+
+class TestLinuxBroadcastAddresses:
+    @staticmethod
+    def _ifreq(name: str, address: str) -> bytes:
+        """A struct ifreq as SIOCGIFBRDADDR fills it in: name, sockaddr_in."""
+        return struct.pack(
+            "16sHH4s", name.encode(), socket.AF_INET, 0, socket.inet_aton(address)
+        ).ljust(256, b"\0")
+
+    def test_parses_ifreq_replies(self, monkeypatch):
+        fcntl = pytest.importorskip("fcntl")
+        replies = {
+            "lo": "127.255.255.255",
+            "eth0": "192.168.1.255",
+            "tun0": "0.0.0.0",
+            "wlan0": "10.0.255.255",
+        }
+
+        def fake_ioctl(fd, request, arg):
+            assert request == discovery_module._SIOCGIFBRDADDR
+            name = arg[:16].rstrip(b"\0").decode()
+            if name not in replies:
+                # No IPv4 address on this interface.
+                raise OSError(99, "Cannot assign requested address")
+            return self._ifreq(name, replies[name])
+
+        monkeypatch.setattr(
+            socket,
+            "if_nameindex",
+            lambda: [(1, "lo"), (2, "eth0"), (3, "tun0"), (4, "wg0"), (5, "wlan0")],
+        )
+        monkeypatch.setattr(fcntl, "ioctl", fake_ioctl)
+
+        assert _linux_broadcast_addresses() == ["192.168.1.255", "10.0.255.255"]
@@ -2,28 +2,119 @@
 Tests for protocol.py — message framing and file transfer helpers.
 """
 
+import contextlib
+import os
 import socket
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from lantern import protocol
+from lantern.config import BUFFER_SIZE, BULK_BUFFER_SIZE
+from lantern.protocol import (
+    MAX_MSG_SIZE,
+    MMAP_MIN_SIZE,
+    _recv_exactly,
+    _recv_exactly_into,
+    _splice_chunk,
+    recv_file,
+    recv_msg,
+    send_file,
+    send_file_data,
+    send_msg,
+    tune_socket,
+)
+
+# ---------------------------------------------------------------------------
+# Fixtures and helpers
+# ---------------------------------------------------------------------------
+
+
+@pytest.fixture(scope="module")
+def listener():
+    """One loopback listener shared by every TCP pair in the module."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        tune_socket(sock)
+        sock.bind(("127.0.0.1", 0))
+        sock.listen(1)
+        yield sock
+
+
+@pytest.fixture(scope="module")
+def sender_pool():
+    """One worker thread that plays the sending peer for every test.
+
+    Tests wait on the submitted future with a timeout, so a stuck sender
+    fails the test instead of hanging it, and the sender's exceptions are
+    re-raised in the test.  Closing the sockets after each test unblocks a
+    sender stuck in send().
+    """
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        yield pool
+
+
+@pytest.fixture(scope="module")
+def large_content():
+    """Random bytes just over MMAP_MIN_SIZE, generated once per module."""
+    return os.urandom(MMAP_MIN_SIZE + 12345)
+
+
+@pytest.fixture(params=["socketpair", "tcp"])
+def sock_pair(request):
+    """A connected (client, server) socket pair, closed after the test.
+
+    Tests using it run once per transport: a socketpair() (Unix-domain
+    where available) and a loopback TCP pair from tcp_pair, so behaviour
+    that only one transport shows, such as partial sends or segment
+    boundaries, is caught on either.  Tests that depend on TCP behaviour
+    use tcp_pair directly.
+    """
+    if request.param == "tcp":
+        yield request.getfixturevalue("tcp_pair")
+        return
+    client, server = socket.socketpair()
+    with client, server:
+        yield client, server
+
+
+@pytest.fixture
+def tcp_pair(listener):
+    """A connected loopback TCP (client, server) pair, closed after the test.
+
+    Both ends are tuned like Lantern's own connections: Nagle off, so small
+    writes are not coalesced.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
+        tune_socket(client)
+        client.connect(listener.getsockname())
+        server, _ = listener.accept()
+        with server:
+            yield client, server
 
-from lantern.protocol import _recv_exactly, recv_file, recv_msg, send_file, send_msg
 
 # ---------------------------------------------------------------------------
-# Helpers
+# tune_socket
 # ---------------------------------------------------------------------------
 
 
-def make_socket_pair():
-    """Return a connected (client, server) socket pair."""
-    server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_sock.bind(("127.0.0.1", 0))
-    server_sock.listen(1)
-    port = server_sock.getsockname()[1]
+class TestTuneSocket:
+    def test_disables_nagle_and_leaves_buffers_to_the_kernel(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            default = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+            tune_socket(sock)
+
+            assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+            assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) == default
+
+    def test_buffer_size_is_opt_in(self, monkeypatch):
+        monkeypatch.setattr(protocol, "SOCKET_BUFFER_SIZE", 32 * 1024)
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            default = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+            tune_socket(sock)
 
-    client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    client.connect(("127.0.0.1", port))
-    server, _ = server_sock.accept()
-    server_sock.close()
-    return client, server
+            assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) != default
 
 
 # ---------------------------------------------------------------------------
@@ -32,41 +123,44 @@ def make_socket_pair():
 
 
 class TestRecvExactly:
-    def test_reads_exact_bytes(self):
-        client, server = make_socket_pair()
-        try:
-            client.sendall(b"hello")
-            result = _recv_exactly(server, 5)
-            assert result == b"hello"
-        finally:
-            client.close()
-            server.close()
+    def test_reads_exact_bytes(self, sock_pair):
+        client, server = sock_pair
+        client.sendall(b"hello")
+        assert _recv_exactly(server, 5) == b"hello"
 
-    def test_returns_none_on_disconnect(self):
-        client, server = make_socket_pair()
+    def test_returns_none_on_disconnect(self, sock_pair):
+        client, server = sock_pair
         client.close()
-        result = _recv_exactly(server, 10)
-        assert result is None
-        server.close()
-
-    def test_reads_across_multiple_chunks(self):
-        """Simulate fragmented delivery by sending bytes one at a time."""
-        client, server = make_socket_pair()
-        try:
-            data = b"fragmented"
-
-            def send_slowly():
-                for byte in data:
-                    client.sendall(bytes([byte]))
-
-            t = threading.Thread(target=send_slowly)
-            t.start()
-            result = _recv_exactly(server, len(data))
-            t.join()
-            assert result == data
-        finally:
-            client.close()
-            server.close()
+        assert _recv_exactly(server, 10) is None
+
+    def test_reads_across_multiple_chunks(self, sender_pool, tcp_pair):
+        """Simulate fragmented delivery by sending the data in pieces."""
+        client, server = tcp_pair
+        data = b"fragmented"
+
+        def send_slowly():
+            for chunk in (data[:3], data[3:7], data[7:]):
+                client.sendall(chunk)
+                # Yield so the receiver can pick up each piece on its own.
+                time.sleep(0)
+
+        future = sender_pool.submit(send_slowly)
+        result = _recv_exactly(server, len(data))
+        future.result(timeout=5)
+        assert result == data
+
+    def test_fills_buffer_in_place(self, sock_pair):
+        client, server = sock_pair
+        buf = bytearray(b"..........")
+        client.sendall(b"hello")
+        assert _recv_exactly_into(server, memoryview(buf)[2:7])
+        assert buf == b"..hello..."
+
+    def test_fill_reports_disconnect(self, sock_pair):
+        client, server = sock_pair
+        client.sendall(b"he")
+        client.close()
+        assert not _recv_exactly_into(server, memoryview(bytearray(5)))
 
 
 # ---------------------------------------------------------------------------
@@ -75,51 +169,35 @@ class TestRecvExactly:
 
 
 class TestMessageFraming:
-    def test_roundtrip_short_message(self):
-        client, server = make_socket_pair()
-        try:
-            send_msg(client, "hello world")
-            assert recv_msg(server) == "hello world"
-        finally:
-            client.close()
-            server.close()
-
-    def test_roundtrip_empty_string(self):
-        client, server = make_socket_pair()
-        try:
-            send_msg(client, "")
-            assert recv_msg(server) == ""
-        finally:
-            client.close()
-            server.close()
-
-    def test_roundtrip_unicode(self):
-        client, server = make_socket_pair()
-        try:
-            msg = "こんにちは — Lantern 🏮"
-            send_msg(client, msg)
-            assert recv_msg(server) == msg
-        finally:
-            client.close()
-            server.close()
-
-    def test_multiple_messages_in_sequence(self):
-        client, server = make_socket_pair()
-        try:
-            messages = ["first", "second", "third"]
-            for m in messages:
-                send_msg(client, m)
-            for m in messages:
-                assert recv_msg(server) == m
-        finally:
-            client.close()
-            server.close()
-
-    def test_recv_returns_none_on_disconnect(self):
-        client, server = make_socket_pair()
+    @pytest.mark.parametrize(
+        "msg",
+        ["hello world", "", "こんにちは — Lantern 🏮"],
+        ids=["short", "empty", "unicode"],
+    )
+    def test_roundtrip(self, sock_pair, msg):
+        client, server = sock_pair
+        send_msg(client, msg)
+        assert recv_msg(server) == msg
+
+    def test_roundtrip_max_size_message(self, sender_pool, sock_pair):
+        client, server = sock_pair
+        msg = "m" * MAX_MSG_SIZE
+        future = sender_pool.submit(send_msg, client, msg)
+        assert recv_msg(server) == msg
+        future.result(timeout=5)
+
+    def test_multiple_messages_in_sequence(self, sock_pair):
+        client, server = sock_pair
+        messages = ["first", "second", "third"]
+        for m in messages:
+            send_msg(client, m)
+        for m in messages:
+            assert recv_msg(server) == m
+
+    def test_recv_returns_none_on_disconnect(self, sock_pair):
+        client, server = sock_pair
         client.close()
         assert recv_msg(server) is None
-        server.close()
 
 
 # ---------------------------------------------------------------------------
@@ -128,63 +206,170 @@ class TestMessageFraming:
 
 
 class TestFileTransfer:
-    def test_roundtrip_small_file(self, tmp_path):
+    def test_symlink_is_refused(self, tmp_path, sock_pair):
+        client, server = sock_pair
+        (tmp_path / "real.bin").write_bytes(b"data")
+        (tmp_path / "link.bin").symlink_to(tmp_path / "real.bin")
+
+        with pytest.raises(ValueError, match="symlink"):
+            send_file(client, str(tmp_path / "link.bin"))
+        client.shutdown(socket.SHUT_WR)
+        assert recv_msg(server) is None
+
+    def test_roundtrip_small_file(self, tmp_path, sock_pair):
+        client, server = sock_pair
         src = tmp_path / "src.bin"
         dst = tmp_path / "dst.bin"
         content = b"binary content 1234"
         src.write_bytes(content)
 
-        client, server = make_socket_pair()
-        try:
+        # The whole file fits in the socket buffer, so it can be sent up
+        # front on this thread.
+        send_file(client, str(src))
+        client.shutdown(socket.SHUT_WR)
 
-            def sender():
-                send_file(client, str(src))
-                client.close()
-
-            t = threading.Thread(target=sender)
-            t.start()
-
-            size_msg = recv_msg(server)
-            assert size_msg is not None
-            filesize = int(size_msg)
-            received = recv_file(server, str(dst), filesize)
-            t.join()
-        finally:
-            server.close()
+        size_msg = recv_msg(server)
+        assert size_msg is not None
+        filesize = int(size_msg)
+        received = recv_file(server, str(dst), filesize)
 
         assert received == len(content)
         assert dst.read_bytes() == content
 
-    def test_roundtrip_empty_file(self, tmp_path):
+    def test_roundtrip_empty_file(self, tmp_path, sock_pair):
+        client, server = sock_pair
         src = tmp_path / "empty.bin"
         dst = tmp_path / "empty_dst.bin"
         src.write_bytes(b"")
 
-        client, server = make_socket_pair()
-        try:
+        # The whole file fits in the socket buffer, so it can be sent up
+        # front on this thread.
+        send_file(client, str(src))
+        client.shutdown(socket.SHUT_WR)
 
-            def sender():
-                send_file(client, str(src))
-                client.close()
+        size_msg = recv_msg(server)
+        assert size_msg is not None
+        filesize = int(size_msg)
+        received = recv_file(server, str(dst), filesize)
+
+        assert received == 0
+        assert dst.read_bytes() == b""
+
+    def test_roundtrip_large_file(self, sender_pool, tmp_path, tcp_pair, large_content):
+        """Files above MMAP_MIN_SIZE are spliced (Linux) or mmapped."""
+        client, server = tcp_pair
+        src = tmp_path / "large.bin"
+        dst = tmp_path / "large_dst.bin"
+        content = large_content
+        src.write_bytes(content)
+
+        # A timeout makes the socket non-blocking underneath, which the
+        # splice path has to wait out itself.
+        server.settimeout(5)
+
+        def sender():
+            send_file(client, str(src))
+            client.close()
+
+        future = sender_pool.submit(sender)
 
-            t = threading.Thread(target=sender)
-            t.start()
+        size_msg = recv_msg(server)
+        assert size_msg is not None
+        received = recv_file(server, str(dst), int(size_msg))
+        future.result(timeout=5)
 
-            size_msg = recv_msg(server)
-            assert size_msg is not None
-            filesize = int(size_msg)
-            received = recv_file(server, str(dst), filesize)
-            t.join()
+        assert received == len(content)
+        assert dst.read_bytes() == content
+        assert sorted(p.name for p in tmp_path.iterdir()) == [
+            "large.bin",
+            "large_dst.bin",
+        ]
+
+    @pytest.mark.skipif(not hasattr(os, "splice"), reason="needs os.splice")
+    def test_splice_waits_on_high_descriptor(self, sender_pool, tmp_path, tcp_pair):
+        """Waiting for data works for descriptors past select()'s 1024 limit."""
+        client, server = tcp_pair
+        try:
+            high = os.dup2(server.fileno(), 1500)
+        except OSError:
+            pytest.skip("cannot open descriptor 1500")
+        sock = socket.socket(fileno=high)
+        sock.settimeout(5)
+        pipe_r, pipe_w = os.pipe()
+        dst = tmp_path / "spliced.bin"
+
+        def sender():
+            time.sleep(0.05)
+            client.sendall(b"payload")
+
+        future = sender_pool.submit(sender)
+        try:
+            with open(dst, "wb") as f:
+                assert _splice_chunk(sock, pipe_r, pipe_w, f.fileno(), 7) == 7
         finally:
-            server.close()
+            sock.close()
+            os.close(pipe_r)
+            os.close(pipe_w)
+        future.result(timeout=5)
+        assert dst.read_bytes() == b"payload"
+
+    def test_roundtrip_large_file_without_splice(
+        self, sender_pool, tmp_path, tcp_pair, large_content, monkeypatch
+    ):
+        monkeypatch.delattr(os, "splice", raising=False)
+        client, server = tcp_pair
+        src = tmp_path / "large.bin"
+        dst = tmp_path / "large_dst.bin"
+        content = large_content
+        src.write_bytes(content)
 
-        assert received == 0
-        assert dst.read_bytes() == b""
+        def sender():
+            send_file(client, str(src))
+            client.close()
+
+        future = sender_pool.submit(sender)
+
+        size_msg = recv_msg(server)
+        assert size_msg is not None
+        received = recv_file(server, str(dst), int(size_msg))
+        future.result(timeout=5)
+
+        assert received == len(content)
+        assert dst.read_bytes() == content
 
-    def test_progress_callback_called(self, tmp_path):
+    @pytest.mark.benchmark
+    def test_throughput_floor(self, sender_pool, tmp_path, tcp_pair):
+        """A few MB over loopback must finish well inside a generous bound.
+
+        A coarse canary for gross slowdowns (tiny chunks, stalls waiting on
+        timeouts); test_uses_sendfile pins the kernel copy path itself.
+        """
+        client, server = tcp_pair
+        src = tmp_path / "bench.bin"
+        dst = tmp_path / "bench_dst.bin"
+        filesize = 4 * 1024 * 1024
+        src.write_bytes(os.urandom(filesize))
+        server.settimeout(5)
+
+        def sender():
+            send_file(client, str(src))
+
+        start = time.perf_counter_ns()
+        future = sender_pool.submit(sender)
+        assert recv_msg(server) == str(filesize)
+        received = recv_file(server, str(dst), filesize)
+        future.result(timeout=5)
+        elapsed = time.perf_counter_ns() - start
+
+        assert received == filesize
+        assert elapsed < 2_000_000_000, f"took {elapsed / 1e9:.2f}s"
+
+    def test_progress_callback_called(self, tmp_path, sock_pair):
+        client, server = sock_pair
         src = tmp_path / "prog.bin"
         dst = tmp_path / "prog_dst.bin"
-        content = b"x" * 8192
+        # Smaller than one progress step, so only the completion is reported.
+        content = b"x" * 64
         src.write_bytes(content)
 
         calls = []
@@ -192,53 +377,132 @@ class TestFileTransfer:
         def progress(current, total):
             calls.append((current, total))
 
-        client, server = make_socket_pair()
-        try:
+        send_file(client, str(src))
+        client.shutdown(socket.SHUT_WR)
 
-            def sender():
-                send_file(client, str(src))
-                client.close()
-
-            t = threading.Thread(target=sender)
-            t.start()
-
-            size_msg = recv_msg(server)
-            assert size_msg is not None
-            filesize = int(size_msg)
-            recv_file(server, str(dst), filesize, progress_callback=progress)
-            t.join()
-        finally:
-            server.close()
+        size_msg = recv_msg(server)
+        assert size_msg is not None
+        filesize = int(size_msg)
+        recv_file(server, str(dst), filesize, progress_callback=progress)
 
-        assert len(calls) > 0
-        assert calls[-1][0] == len(content)
+        assert calls == [(len(content), len(content))]
 
-    def test_cancel_event_stops_transfer(self, tmp_path):
+    def test_cancel_event_stops_transfer(self, sender_pool, tmp_path, sock_pair):
+        client, server = sock_pair
         src = tmp_path / "big.bin"
         dst = tmp_path / "big_dst.bin"
-        content = b"z" * (1024 * 64)  # 64 KB
-        src.write_bytes(content)
+        filesize = 1024 * 64  # 64 KB
+        # Contents don't matter here: a sparse file of that size will do.
+        src.touch()
+        os.truncate(src, filesize)
 
         cancel = threading.Event()
         cancel.set()  # Cancel immediately
 
-        client, server = make_socket_pair()
-        try:
+        def sender():
+            send_file(client, str(src))
+            client.close()
 
-            def sender():
+        future = sender_pool.submit(sender)
+
+        size_msg = recv_msg(server)
+        assert size_msg == str(filesize)
+        received = recv_file(server, str(dst), filesize, cancel_event=cancel)
+        future.result(timeout=5)
+
+        # Cancelled before the first read: nothing is received and no
+        # partial file is left behind.
+        assert received == 0
+        assert not dst.exists()
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["big.bin"]
+
+    def test_cancel_mid_transfer_stops_within_a_chunk(
+        self, sender_pool, tmp_path, tcp_pair
+    ):
+        client, server = tcp_pair
+        src = tmp_path / "big.bin"
+        dst = tmp_path / "big_dst.bin"
+        filesize = 4 * 1024 * 1024
+        src.touch()
+        os.truncate(src, filesize)
+
+        cancel = threading.Event()
+
+        def sender():
+            # The receiver stops reading and hangs up part-way through.
+            with contextlib.suppress(OSError):
                 send_file(client, str(src))
-                client.close()
 
-            t = threading.Thread(target=sender)
-            t.start()
+        future = sender_pool.submit(sender)
 
-            size_msg = recv_msg(server)
-            assert size_msg is not None
-            filesize = int(size_msg)
-            received = recv_file(server, str(dst), filesize, cancel_event=cancel)
-            t.join()
-        finally:
-            server.close()
+        assert recv_msg(server) == str(filesize)
+        received = recv_file(
+            server,
+            str(dst),
+            filesize,
+            progress_callback=lambda current, total: cancel.set(),
+            cancel_event=cancel,
+        )
+        server.close()
+        future.result(timeout=5)
+
+        # The first progress report comes after at most BUFFER_SIZE bytes
+        # (plus the read that crossed it); the next read must not happen.
+        assert 0 < received <= BUFFER_SIZE + BULK_BUFFER_SIZE
+        assert not dst.exists()
+
+
+# ---------------------------------------------------------------------------
+# send_file_data
+# ---------------------------------------------------------------------------
 
-        # Transfer was cancelled — received should be less than total
-        assert received < len(content)
+
+class TestSendFileData:
+    def test_streams_raw_bytes(self, tmp_path, sock_pair):
+        client, server = sock_pair
+        src = tmp_path / "raw.bin"
+        content = b"raw payload without framing"
+        src.write_bytes(content)
+
+        calls = []
+        with open(src, "rb") as f:
+            sent = send_file_data(
+                client,
+                f,
+                len(content),
+                progress_callback=lambda c, t: calls.append((c, t)),
+            )
+        assert sent == len(content)
+        assert _recv_exactly(server, len(content)) == content
+        assert calls[-1] == (len(content), len(content))
+
+    @pytest.mark.skipif(not hasattr(os, "sendfile"), reason="needs os.sendfile")
+    def test_uses_sendfile(self, tmp_path, tcp_pair, monkeypatch):
+        """The body is copied file -> socket in the kernel, not read and sent."""
+        calls = []
+        real_sendfile = os.sendfile
+
+        def counting_sendfile(*args):
+            calls.append(args)
+            return real_sendfile(*args)
+
+        monkeypatch.setattr(os, "sendfile", counting_sendfile)
+        client, server = tcp_pair
+        src = tmp_path / "raw.bin"
+        content = os.urandom(100_000)
+        src.write_bytes(content)
+
+        with open(src, "rb") as f:
+            assert send_file_data(client, f, len(content)) == len(content)
+        assert _recv_exactly(server, len(content)) == content
+        assert calls
+
+    def test_cancel_event_sends_nothing(self, tmp_path, sock_pair):
+        client, _ = sock_pair
+        src = tmp_path / "raw.bin"
+        src.write_bytes(b"data")
+
+        cancel = threading.Event()
+        cancel.set()
+        with open(src, "rb") as f:
+            assert send_file_data(client, f, 4, cancel_event=cancel) == 0
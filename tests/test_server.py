@@ -0,0 +1,115 @@
+"""
+Tests for server.py — LIST caching, idle connections and upload requests.
+"""
+
+import socket
+import threading
+import time
+
+import pytest
+
+from lantern import server
+from lantern.protocol import recv_msg, send_msg
+
+
+@pytest.fixture
+def running_server(tmp_path, monkeypatch):
+    """A started FileServer sharing tmp_path; yields (server, shared dir)."""
+    monkeypatch.setattr(server, "SHARED_DIR", str(tmp_path))
+
+    probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+
+    srv = server.FileServer(port=port)
+    srv.start()
+    deadline = time.monotonic() + 5
+    while srv._sock is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    yield srv, tmp_path
+    srv.stop()
+
+
+def connect(srv: server.FileServer) -> socket.socket:
+    return socket.create_connection(("127.0.0.1", srv.port), timeout=5)
+
+
+class TestConnection:
+    def test_idle_connection_is_closed(self, running_server, monkeypatch):
+        srv, _ = running_server
+        monkeypatch.setattr(server, "CONNECTION_IDLE_TIMEOUT", 0.1)
+
+        with connect(srv) as sock:
+            send_msg(sock, "LIST")
+            assert recv_msg(sock) == "OK<SEP>"
+            assert recv_msg(sock) is None
+
+
+class TestList:
+    def test_listing_is_cached_until_ttl(self, running_server, monkeypatch):
+        srv, shared = running_server
+        (shared / "a.txt").write_bytes(b"alpha")
+
+        with connect(srv) as sock:
+            send_msg(sock, "LIST")
+            assert recv_msg(sock) == "OK<SEP>a.txt<SEP>5"
+
+            (shared / "b.txt").write_bytes(b"beta")
+            send_msg(sock, "LIST")
+            assert recv_msg(sock) == "OK<SEP>a.txt<SEP>5"
+
+            monkeypatch.setattr(server, "LIST_CACHE_TTL", 0)
+            send_msg(sock, "LIST")
+            assert "b.txt<SEP>4" in recv_msg(sock)
+
+    def test_unchanged_listing_is_not_resent(self, running_server):
+        srv, shared = running_server
+        (shared / "a.txt").write_bytes(b"alpha")
+
+        with connect(srv) as sock:
+            send_msg(sock, "LIST<SEP>")
+            status, tag, listing = recv_msg(sock).split("<SEP>", 2)
+            assert (status, listing) == ("MODIFIED", "a.txt<SEP>5")
+
+            send_msg(sock, f"LIST<SEP>{tag}")
+            assert recv_msg(sock) == "NOT_MODIFIED"
+            send_msg(sock, "LIST")
+            assert recv_msg(sock) == "OK<SEP>a.txt<SEP>5"
+
+    def test_changed_listing_has_new_tag(self, running_server, monkeypatch):
+        srv, shared = running_server
+        monkeypatch.setattr(server, "LIST_CACHE_TTL", 0)
+        (shared / "a.txt").write_bytes(b"alpha")
+
+        with connect(srv) as sock:
+            send_msg(sock, "LIST<SEP>")
+            _, tag, _ = recv_msg(sock).split("<SEP>", 2)
+            (shared / "a.txt").write_bytes(b"alphabet")
+
+            send_msg(sock, f"LIST<SEP>{tag}")
+            status, new_tag, listing = recv_msg(sock).split("<SEP>", 2)
+            assert (status, listing) == ("MODIFIED", "a.txt<SEP>8")
+            assert new_tag != tag
+
+
+class TestUploadRequest:
+    def test_stop_rejects_request_being_decided(self, running_server):
+        srv, _ = running_server
+        with connect(srv) as sock:
+            send_msg(sock, "UPLOAD_REQUEST<SEP>a.txt<SEP>5")
+            deadline = time.monotonic() + 5
+            while not srv.pending_uploads and time.monotonic() < deadline:
+                time.sleep(0.01)
+            # Taken by the TUI, which is showing the accept/reject dialog.
+            request = srv.pending_uploads.popleft()
+
+            srv.stop()
+
+            assert request.decision_event.wait(timeout=2)
+            assert not request.accepted
+            # No worker is left blocked, so interpreter exit won't stall.
+            joiner = threading.Thread(target=srv._pool.shutdown)
+            joiner.start()
+            joiner.join(timeout=2)
+            assert not joiner.is_alive()